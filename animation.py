@@ -0,0 +1,180 @@
+from __future__ import annotations
+from bisect import bisect_right
+from typing import Dict, List, Sequence, Tuple
+from basetypes import Map, Position, RenderData, Tile, Unit
+
+
+class Animation:
+    """Precomputed sequence of frames, each shown for a number of ticks
+
+    The encoded cell of every frame is computed once, so drawing an animated cell never has to encode it again
+
+    :param Sequence[Tuple[RenderData,int]] frames: Frames and their durations in ticks
+    :except ValueError: If there are no frames or a duration is smaller than 1
+    """
+
+    def __init__(self, frames: Sequence[Tuple[RenderData, int]]):
+        if not frames:
+            raise ValueError("Animation must have at least one frame")
+
+        self.frames: List[RenderData] = []
+        self.starts: List[int] = []
+        self.length = 0
+        for frame, duration in frames:
+            if duration < 1:
+                raise ValueError("Duration must be a positive integer")
+            self.frames.append(frame)
+            self.starts.append(self.length)
+            self.length += duration
+        self.encoded = [RenderData.encode(frame) for frame in self.frames]
+
+    def index_at(self, tick: int):
+        return bisect_right(self.starts, tick % self.length) - 1
+
+    def next_change(self, tick: int):
+        """Returns the first tick after the given one on which a different frame is shown"""
+        local = tick % self.length
+        index = bisect_right(self.starts, local) - 1
+        end = self.starts[index + 1] if index + 1 < len(self.starts) else self.length
+        return tick - local + end
+
+
+class Animated:
+    """An animation playing on a tile or unit
+
+    :param Tile|Unit owner: The tile or unit the animation is drawn on
+    :param Animation animation: The played animation
+    :param int start: Tick of the animator clock the animation started on
+    """
+
+    def __init__(self, owner: Tile | Unit, animation: Animation, start: int):
+        self.owner = owner
+        self.animation = animation
+        self.start = start
+        self.index = 0
+        self.animator: Animator | None = None
+
+    def __getstate__(self):
+        # Animators are attached to a map, they have to be reattached after loading
+        state = self.__dict__.copy()
+        state["animator"] = None
+        return state
+
+    @property
+    def frame(self):
+        return self.animation.frames[self.index]
+
+    @property
+    def encoded(self):
+        return self.animation.encoded[self.index]
+
+    def draw(self, data: RenderData):
+        frame = self.frame
+        if frame.fg_color:
+            data.fg_color = frame.fg_color
+        if frame.bg_color:
+            data.bg_color = frame.bg_color
+        if frame.text:
+            data.text = frame.text
+
+
+class Animator:
+    """Advances the animations of a map with its ticks
+
+    Animations are kept in buckets by the tick of their next frame change, so a tick only costs as much as
+    the amount of cells whose visible frame actually changes on it. Only those cells are marked dirty.
+    Animations of tiles and units that left the map are dropped once they become due, they start playing
+    again when :meth:`adopt` is called for them
+
+    :param Map _map: The map ticking the animator, all animated tiles already in it are attached
+    """
+
+    def __init__(self, _map: Map):
+        self.map = _map
+        self.clock = 0
+        self._due: Dict[int, List[Animated]] = {}
+        _map.animator = self
+        for tile in _map.tiles.values():
+            self.adopt(tile)
+
+    def adopt(self, owner: Tile | Unit):
+        """Plays the animation of a tile or unit added to the map, unless it is already playing"""
+        animated = getattr(owner, "animated", None)
+        if animated:
+            if animated.animator is not self:
+                # Keep the phase the animation had before
+                self.attach(owner, animated.animation, self.clock - animated.start)
+        elif isinstance(owner, AnimatedTile) and owner.animation:
+            self.attach(owner, owner.animation)
+
+    def attach(self, owner: AnimatedTile | AnimatedUnit, animation: Animation, phase: int = 0):
+        """Starts playing an animation on a tile or unit, replacing the one it played before
+
+        :param int phase: Amount of ticks the animation is ahead of the animator clock
+        :returns: The playing animation
+        :rtype: Animated
+        """
+        if owner.animated:
+            self.detach(owner.animated)
+        animated = Animated(owner, animation, self.clock - phase)
+        animated.index = animation.index_at(self.clock - animated.start)
+        animated.animator = self
+        owner.animated = animated
+        owner.invalidate()
+        self._schedule(animated)
+        return animated
+
+    @staticmethod
+    def detach(animated: Animated):
+        # Removed from its bucket lazily, once it becomes due
+        animated.animator = None
+
+    def _schedule(self, animated: Animated):
+        if len(animated.animation.frames) > 1:
+            at = animated.start + animated.animation.next_change(self.clock - animated.start)
+            self._due.setdefault(at, []).append(animated)
+
+    def _on_map(self, owner: Tile | Unit):
+        tile = owner.tile if isinstance(owner, Unit) else owner
+        return tile is not None and tile.map is self.map
+
+    def tick(self):
+        self.clock += 1
+        for animated in self._due.pop(self.clock, ()):
+            if animated.animator is not self:
+                continue
+            if not self._on_map(animated.owner):
+                animated.animator = None
+                continue
+            animated.index = animated.animation.index_at(self.clock - animated.start)
+            animated.owner.invalidate()
+            self._schedule(animated)
+
+
+class AnimatedTile(Tile):
+    """Tile drawn from an animation, attached once the map gets an :class:`Animator`"""
+
+    def __init__(self, position: Position = Position(0, 0), animation: Animation | None = None):
+        super().__init__(position)
+        self.animation = animation
+        self.animated: Animated | None = None
+
+    def on_draw(self, data: RenderData):
+        if self.animated:
+            self.animated.draw(data)
+
+    def encode(self, data: RenderData):
+        entities = self.map.entities if self.map else None
+        if self.animated and not self.units and (not entities or entities.entity_at(self.position) < 0):
+            return self.animated.encoded
+        return super().encode(data)
+
+
+class AnimatedUnit(Unit):
+    def __init__(self):
+        super().__init__()
+        self.animated: Animated | None = None
+
+    def on_draw(self, data: RenderData):
+        if self.animated:
+            self.animated.draw(data)
@@ -1,8 +1,15 @@
 from __future__ import annotations
 from os import get_terminal_size
-from typing import NamedTuple, ClassVar, Tuple, Dict
+from bisect import bisect_right
+from enum import IntEnum
+from typing import NamedTuple, ClassVar, Callable, Tuple, Dict, List, TYPE_CHECKING
 from termansi import fwrite, combine_modes, ColorRGB, GraphicMode, Terminal
-from dataclasses import dataclass
+
+if TYPE_CHECKING:
+    from animation import Animator
+    from entities import EntityStore
+    from minimap import Minimap
+    from snapshot import Journal
 
 
 class Color(NamedTuple):
@@ -11,8 +18,10 @@ class Color(NamedTuple):
     b: int
 
 
-@dataclass(frozen=True)
 class Position:
+    # Written out by hand instead of using a frozen dataclass, importing dataclasses is a large part of startup
+    __slots__ = ("x", "y")
+
     UP: ClassVar[Position]
     DOWN: ClassVar[Position]
     LEFT: ClassVar[Position]
@@ -21,6 +30,30 @@ class Position:
     x: int
     y: int
 
+    def __init__(self, x: int, y: int):
+        object.__setattr__(self, "x", x)
+        object.__setattr__(self, "y", y)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"cannot delete field '{name}'")
+
+    def __reduce__(self):
+        return Position, (self.x, self.y)
+
+    def __repr__(self):
+        return f"Position(x={self.x}, y={self.y})"
+
+    def __eq__(self, other):
+        if other.__class__ is self.__class__:
+            return self.x == other.x and self.y == other.y
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
     def __add__(self, other: Position):
         if not isinstance(other, Position):
             raise TypeError(f"Cannot apply + to {type(self)} and {type(other)}")
@@ -56,6 +89,15 @@ class Position:
         return Position(-self.x, -self.y)
 
 
+class Layer(IntEnum):
+    """Draw order of everything in a cell, higher layers are drawn over lower ones"""
+    TERRAIN = 0
+    ITEMS = 1
+    UNITS = 2
+    EFFECTS = 3
+    OVERLAY = 4
+
+
 class Drawable:
     def on_draw(self, data: RenderData): ...
 
@@ -79,38 +121,69 @@ class Dirty:
 
 
 class RenderData:
-    fg_color: Color | None = None
-    bg_color: Color | None = None
-    text: str | None = None
+    __slots__ = ("fg_color", "bg_color", "text")
 
-    @staticmethod
-    def render(position: Position, data: RenderData):
-        fwrite(Terminal.move_position(position.x * 2 + 1, position.y + 1),
-               combine_modes(
-                    ColorRGB.fg(*data.fg_color) if data.fg_color else GraphicMode.RESET_FG,
-                    ColorRGB.bg(*data.bg_color) if data.bg_color else GraphicMode.RESET_BG),
-               data.text or "  ")
+    fg_color: Color | None
+    bg_color: Color | None
+    text: str | None
+
+    def __init__(self, fg_color: Color | None = None, bg_color: Color | None = None, text: str | None = None):
+        self.fg_color = fg_color
+        self.bg_color = bg_color
+        self.text = text
 
-    def __and__(self, other):
-        if not isinstance(other, RenderData):
-            raise TypeError("Expected RenderData, got " + str(type(other)))
+    def reset(self):
+        self.fg_color = None
+        self.bg_color = None
+        self.text = None
 
-        combined = RenderData()
-        combined.fg_color = other.fg_color or self.fg_color
-        combined.bg_color = other.bg_color or self.bg_color
-        combined.text = other.text or self.text
+    @staticmethod
+    def render(position: Position, data: RenderData):
+        fwrite(Terminal.move_position(position.x * 2 + 1, position.y + 1), RenderData.encode(data))
 
-        return combined
+    @staticmethod
+    def encode(data: RenderData):
+        return combine_modes(
+            ColorRGB.fg(*data.fg_color) if data.fg_color else GraphicMode.RESET_FG,
+            ColorRGB.bg(*data.bg_color) if data.bg_color else GraphicMode.RESET_BG) + (data.text or "  ")
 
+    @staticmethod
+    def compose(tile: Tile, data: RenderData):
+        """Draws the tile and all of its units into data, from the lowest layer to the highest
+
+        Every layer only overwrites what it draws, so the record can be reused for every cell of a frame
+        """
+        data.reset()
+        tile.on_draw(data)
+        entities = tile.map.entities if tile.map else None
+        entity = entities.entity_at(tile.position) if entities else -1
+        for unit in tile.units:
+            if entity >= 0 and unit.layer > entities.layer:
+                entities.draw(entity, data)
+                entity = -1
+            unit.on_draw(data)
+        if entity >= 0:
+            entities.draw(entity, data)
+        return data
+
+
+class Unit(Drawable, Dirty):
+    layer: ClassVar[Layer] = Layer.UNITS
 
-class Unit(Drawable):
     @property
     def position(self):
         return self.tile.position if self.tile else None
 
     def __init__(self):
+        super().__init__(True)
         self.tile: Tile | None = None
 
+    def invalidate(self):
+        """Marks the unit dirty after its look changed, unlike setting is_dirty this also notifies the map"""
+        self.is_dirty = True
+        if self.tile:
+            self.tile.invalidate()
+
     def on_enter(self, tile: Tile):
         ...
 
@@ -136,20 +209,73 @@ class Unit(Drawable):
 class Tile(Drawable, Dirty):
     @property
     def unit(self):
-        return self._unit
+        """The unit occupying the UNITS layer, at most one such unit can stand on a tile"""
+        for unit in self._units:
+            if unit.layer == Layer.UNITS:
+                return unit
+        return None
 
     @unit.setter
-    def unit(self, value: Unit):
-        if self._unit != value:
-            self._unit = value
-            self.is_dirty = True
+    def unit(self, value: Unit | None):
+        current = self.unit
+        if current is not value:
+            if current:
+                self.remove(current)
             if value:
-                self._unit.tile = self
+                self.add(value)
+
+    @property
+    def units(self):
+        """All units on the tile ordered by layer, must not be modified directly"""
+        return self._units
+
+    @property
+    def needs_redraw(self):
+        return self.is_dirty or any(unit.is_dirty for unit in self._units)
 
     def __init__(self, position: Position = Position(0, 0)):
         super().__init__(True)
-        self._unit: Unit | None = None
+        self._units: List[Unit] = []
         self.position = position
+        self.map: Map | None = None
+
+    def __getstate__(self):
+        # Tiles are saved and sent between processes on their own, never together with their map
+        state = self.__dict__.copy()
+        state["map"] = None
+        return state
+
+    def add(self, unit: Unit):
+        if self.map and self.map.journal:
+            self.map.journal.record(self.position)
+        # Keep insertion order within a layer
+        index = bisect_right([u.layer for u in self._units], unit.layer)
+        self._units.insert(index, unit)
+        unit.tile = self
+        self.invalidate()
+
+    def remove(self, unit: Unit):
+        if self.map and self.map.journal:
+            self.map.journal.record(self.position)
+        self._units.remove(unit)
+        if unit.tile is self:
+            unit.tile = None
+        self.invalidate()
+
+    def invalidate(self):
+        """Marks the tile dirty after its look changed, unlike setting is_dirty this also notifies the map"""
+        self.is_dirty = True
+        if self.map:
+            self.map.invalidate(self.position)
+
+    def encode(self, data: RenderData):
+        """Returns the encoded cell of the tile, using data as the scratch record"""
+        return RenderData.encode(RenderData.compose(self, data))
+
+    def clean(self):
+        self.is_dirty = False
+        for unit in self._units:
+            unit.is_dirty = False
 
     # noinspection PyMethodMayBeStatic,PyUnusedLocal
     def can_enter(self, unit: Unit):
@@ -165,8 +291,10 @@ class Tile(Drawable, Dirty):
         ...
 
     def on_tick(self):
-        if self.unit:
-            self.unit.on_tick()
+        # Units may leave the tile while ticking
+        for unit in tuple(self._units):
+            if unit.tile is self:
+                unit.on_tick()
 
 
 class Camera:
@@ -179,7 +307,7 @@ class Camera:
     @origin.setter
     def origin(self, value):
         self._origin = value
-        self.render(True)
+        self.invalidated = True
 
     @property
     def frustum(self):
@@ -192,6 +320,8 @@ class Camera:
     def __init__(self, origin: Position = Position(0, 0), frustum: Tuple[int, int] = None):
         self._origin = origin
         self._frustum = frustum or Camera.get_frustum()
+        # Set when the whole view has to be redrawn on the next render
+        self.invalidated = False
 
     def is_visible(self, position: Position):
         actual = self.origin + position
@@ -199,22 +329,21 @@ class Camera:
         return not (actual.x < 0 or actual.y < 0 or actual.x > frustum[0] or actual.y > frustum[1])
 
     def render(self, force=False):
+        force = force or self.invalidated
+        self.invalidated = False
         if force:
             fwrite(GraphicMode.RESET, Terminal.erase_screen())
+        if Map.current.entities:
+            Map.current.entities.flush()
+        data = RenderData()
         for tile in Map.current.tiles.values():
-            if not Camera.current.is_visible(tile.position):
+            if not self.is_visible(tile.position):
                 continue
 
-            if force or tile.is_dirty or (tile.unit and tile.unit.is_dirty):
-                tile_data = RenderData()
-                tile.on_draw(tile_data)
-                if tile.unit:
-                    unit_data = RenderData()
-                    tile.unit.on_draw(unit_data)
-                    tile_data = tile_data & unit_data
-                    tile.unit.is_dirty = False
-                RenderData.render(tile.position + self.origin, tile_data)
-                tile.is_dirty = False
+            if force or tile.needs_redraw:
+                position = tile.position + self.origin
+                fwrite(Terminal.move_position(position.x * 2 + 1, position.y + 1), tile.encode(data))
+                tile.clean()
         fwrite(Terminal.MOVE_HOME)
 
     @staticmethod
@@ -230,16 +359,64 @@ class Map:
     def __init__(self, tiles: Dict[Position, Tile]):
         for [pos, tile] in tiles.items():
             tile.position = pos
+            tile.map = self
 
         self.tiles = tiles
+        self.journal: Journal | None = None
+        self.animator: Animator | None = None
+        self.entities: EntityStore | None = None
+        self.minimap: Minimap | None = None
+        # Called with every invalidated position, for renderers that only redraw what changed
+        self.listeners: List[Callable[[Position], None]] = []
 
     def tick(self):
+        if self.animator:
+            self.animator.tick()
+        if self.entities:
+            self.entities.tick()
         for tile in self.tiles.values():
             tile.on_tick()
 
     def tile_at(self, position: Position):
         return self.tiles[position] if position in self.tiles else None
 
+    def bounds(self):
+        """Smallest rectangle containing every tile of the map
+
+        :returns: Top left corner, width and height
+        :rtype: Tuple[Position,int,int]
+        :except ValueError: If the map has no tiles
+        """
+        if not self.tiles:
+            raise ValueError("Map has no tiles")
+        xs = [pos.x for pos in self.tiles]
+        ys = [pos.y for pos in self.tiles]
+        origin = Position(min(xs), min(ys))
+        return origin, max(xs) - origin.x + 1, max(ys) - origin.y + 1
+
+    def set_tile(self, position: Position, tile: Tile):
+        old_tile = self.tile_at(position)
+        if old_tile is tile:
+            return
+        if self.journal:
+            self.journal.record(position)
+        if old_tile:
+            old_tile.map = None
+
+        tile.position = position
+        tile.map = self
+        self.tiles[position] = tile
+        tile.invalidate()
+        if self.animator:
+            self.animator.adopt(tile)
+
+    def invalidate(self, position: Position):
+        """Called whenever the look of a cell may have changed, the cell is drawn again later"""
+        if self.minimap:
+            self.minimap.invalidate(position)
+        for listener in self.listeners:
+            listener(position)
+
     def try_move_unit(self, unit: Unit, position: Position):
         if unit.position == position:
             return True
@@ -247,42 +424,53 @@ class Map:
         new_tile = self.tile_at(position)
         if not new_tile:
             return False
-        if new_tile.unit:
+        if unit.layer == Layer.UNITS and new_tile.unit:
             new_tile.unit.on_contact(unit)
             unit.on_contact(new_tile.unit)
             return False
         if not new_tile.can_enter(unit):
             return False
 
-        old_tile = self.tile_at(unit.position)
-        old_unit = old_tile.unit
-        old_tile.unit = None
-        new_tile.unit = old_unit
+        old_tile = unit.tile
+        old_tile.remove(unit)
+        new_tile.add(unit)
         old_tile.on_leave(unit)
         unit.on_leave(old_tile)
         new_tile.on_enter(unit)
         unit.on_enter(new_tile)
+        Map.touch_units(unit, new_tile)
 
         return True
 
     def try_spawn_unit(self, unit: Unit, tile: Tile):
-        if not tile or tile.unit or not tile.can_enter(unit):
+        if not tile or (unit.layer == Layer.UNITS and tile.unit) or not tile.can_enter(unit):
             return False
 
-        tile.unit = unit
+        tile.add(unit)
+        if self.animator:
+            self.animator.adopt(unit)
         unit.on_spawn(tile, self)
         tile.on_enter(unit)
         unit.on_enter(tile)
+        return True
 
     def try_remove_unit(self, unit: Unit):
-        tile = self.tile_at(unit.position)
+        tile = unit.tile
         if not tile:
             raise ValueError("Unit is not spawned")
         tile.on_leave(unit)
         unit.on_leave(tile)
-        tile.unit = None
+        tile.remove(unit)
         unit.on_remove(self)
 
+    @staticmethod
+    def touch_units(unit: Unit, tile: Tile):
+        """Lets a unit that entered a tile contact everything else lying on it"""
+        for other in tuple(tile.units):
+            if other is not unit and other.tile is tile and unit.tile is tile:
+                other.on_contact(unit)
+                unit.on_contact(other)
+
 
 # Define constants
 Position.UP = Position(0, -1)
@@ -0,0 +1,228 @@
+from __future__ import annotations
+from typing import Callable, List, Tuple
+import numpy as np
+from basetypes import Color, Layer, Map, Position, RenderData
+
+System = Callable[["EntityStore"], None]
+
+
+class EntityStore:
+    """Structure of arrays for large amounts of simple entities, such as particles, crowds or projectiles
+
+    Entities are not units, they have no hooks and do not take part in :meth:`Map.try_move_unit`. Their positions,
+    velocities and looks are kept in NumPy arrays which systems update all at once. After every tick the cells
+    whose look changed are marked in the :attr:`dirty` mask in one pass, and :meth:`RenderData.compose` draws
+    the entity on top of its cell at the store's layer. Tiles are only invalidated once something that draws them
+    calls :meth:`flush`, renderers only flush the area they show
+
+    Only covers the tiles the map had when the store was created, entities can not leave that rectangle
+
+    :param Map _map: The map the entities live on, the store attaches itself to it
+    :param int capacity: Amount of entities space is reserved for, grows as needed (default 1024)
+    :param Layer layer: Layer the entities are drawn at (default EFFECTS)
+    """
+
+    def __init__(self, _map: Map, capacity: int = 1024, layer: Layer = Layer.EFFECTS):
+        self.map = _map
+        self.layer = layer
+        self.systems: List[System] = [EntityStore.move]
+
+        self.origin, self.width, self.height = _map.bounds()
+        self._tiles = [None] * (self.width * self.height)
+        self.solid = np.ones(self.width * self.height, dtype=bool)
+        for pos, tile in _map.tiles.items():
+            index = (pos.y - self.origin.y) * self.width + pos.x - self.origin.x
+            self._tiles[index] = tile
+            self.solid[index] = not tile.can_enter(None)
+        # Index of the entity drawn in every cell, -1 if there is none. The most recently spawned entity is on top
+        self.top = np.full(self.width * self.height, -1, dtype=np.int64)
+        # Cells whose look changed since their tile was last invalidated by flush
+        self.dirty = np.zeros(self.width * self.height, dtype=bool)
+
+        # Every slot below count is either alive or in the free list
+        self.count = 0
+        self._free: List[int] = []
+        self._sequence = 0
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.vx = np.zeros(capacity, dtype=np.int32)
+        self.vy = np.zeros(capacity, dtype=np.int32)
+        self.fg = np.zeros((capacity, 3), dtype=np.uint8)
+        self.bg = np.zeros((capacity, 3), dtype=np.uint8)
+        self.has_fg = np.zeros(capacity, dtype=bool)
+        self.has_bg = np.zeros(capacity, dtype=bool)
+        self.text = np.full(capacity, "", dtype="<U2")
+        self._cells = np.zeros(capacity, dtype=np.int64)
+        # Order the entities were spawned in, slots are reused so the index says nothing about it
+        self.spawned = np.zeros(capacity, dtype=np.int64)
+        _map.entities = self
+
+    @property
+    def capacity(self):
+        return len(self.alive)
+
+    def _grow(self, needed: int):
+        capacity = max(needed, self.capacity * 2)
+        for name in ("alive", "x", "y", "vx", "vy", "fg", "bg", "has_fg", "has_bg", "text", "_cells", "spawned"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def spawn(self, x, y, vx=0, vy=0, fg: Color | None = None, bg: Color | None = None, text: str = ""):
+        """Adds entities, every argument may be a scalar or an array with one value per entity
+
+        Slots of killed entities are reused before new ones are taken
+
+        :returns: Indices of the new entities
+        :rtype: numpy.ndarray
+        :except ValueError: If a position is outside the rectangle covered by the store
+        """
+        x, y, vx, vy = np.broadcast_arrays(*(np.atleast_1d(np.asarray(v, dtype=np.int32)) for v in (x, y, vx, vy)))
+        if ((x < self.origin.x) | (x >= self.origin.x + self.width) |
+                (y < self.origin.y) | (y >= self.origin.y + self.height)).any():
+            raise ValueError("Entities must be spawned inside the rectangle covered by the store")
+
+        n = len(x)
+        reused = min(n, len(self._free))
+        fresh = n - reused
+        if self.count + fresh > self.capacity:
+            self._grow(self.count + fresh)
+
+        ids = np.concatenate((np.array(self._free[len(self._free) - reused:], dtype=np.int64),
+                              np.arange(self.count, self.count + fresh)))
+        del self._free[len(self._free) - reused:]
+        self.count += fresh
+        self.alive[ids] = True
+        self.x[ids], self.y[ids], self.vx[ids], self.vy[ids] = x, y, vx, vy
+        self.has_fg[ids] = fg is not None
+        self.has_bg[ids] = bg is not None
+        self.fg[ids] = fg or (0, 0, 0)
+        self.bg[ids] = bg or (0, 0, 0)
+        self.text[ids] = text
+        self.spawned[ids] = np.arange(self._sequence, self._sequence + n)
+        self._sequence += n
+        self._cells[ids] = self._index(self.x[ids], self.y[ids])
+        cells = np.unique(self._cells[ids])
+        self._rescatter(cells)
+        self._invalidate(cells)
+        return ids
+
+    def kill(self, ids):
+        ids = np.atleast_1d(np.asarray(ids))
+        ids = np.unique(ids[self.alive[ids]])
+        self.alive[ids] = False
+        self._free.extend(ids.tolist())
+        cells = np.unique(self._cells[ids])
+        # Uncover entities that were hidden below the killed ones
+        self._rescatter(cells)
+        self._invalidate(cells)
+
+    def _index(self, x, y):
+        return (y - self.origin.y) * self.width + x - self.origin.x
+
+    def _scatter(self, ids):
+        # Later assignments win, so the entities are ordered by spawn time first
+        ids = ids[np.argsort(self.spawned[ids], kind="stable")]
+        self.top[self._cells[ids]] = ids
+
+    def _rescatter(self, cells):
+        """Recomputes the drawn entity of the given cells only"""
+        n = self.count
+        self.top[cells] = -1
+        self._scatter(np.flatnonzero(self.alive[:n] & np.isin(self._cells[:n], cells)))
+
+    def _invalidate(self, cells):
+        self.dirty[cells] = True
+
+    def flush(self, area: Tuple[int, int, int, int] | None = None):
+        """Invalidates the tiles of dirty cells, so they are drawn again
+
+        :param Tuple[int,int,int,int]|None area: Left, top, width and height of the flushed rectangle in map
+            coordinates, the whole store if None
+        """
+        if area is None:
+            cells = np.flatnonzero(self.dirty)
+        else:
+            left, top, width, height = area
+            x0 = max(left - self.origin.x, 0)
+            y0 = max(top - self.origin.y, 0)
+            x1 = min(left + width - self.origin.x, self.width)
+            y1 = min(top + height - self.origin.y, self.height)
+            if x0 >= x1 or y0 >= y1:
+                return
+            ys, xs = np.nonzero(self.dirty.reshape(self.height, self.width)[y0:y1, x0:x1])
+            cells = (ys + y0) * self.width + xs + x0
+        if not len(cells):
+            return
+
+        self.dirty[cells] = False
+        tiles = self._tiles
+        for index in cells.tolist():
+            tile = tiles[index]
+            if tile:
+                tile.invalidate()
+
+    @staticmethod
+    def move(store: EntityStore):
+        """Moves every entity by its velocity, entities bounce off solid tiles and the edges of the store"""
+        n = store.count
+        alive = store.alive[:n]
+        x = store.x[:n] + store.vx[:n]
+        y = store.y[:n] + store.vy[:n]
+        inside = (x >= store.origin.x) & (x < store.origin.x + store.width) & \
+                 (y >= store.origin.y) & (y < store.origin.y + store.height)
+        blocked = ~inside
+        blocked[inside] = store.solid[store._index(x[inside], y[inside])]
+        blocked &= alive
+        free = alive & ~blocked
+        store.x[:n][free] = x[free]
+        store.y[:n][free] = y[free]
+        store.vx[:n][blocked] *= -1
+        store.vy[:n][blocked] *= -1
+
+    def tick(self):
+        for system in self.systems:
+            system(self)
+
+        n = self.count
+        ids = np.flatnonzero(self.alive[:n])
+        old = self._cells[ids]
+        new = self._index(self.x[ids], self.y[ids])
+        moved = old != new
+        if not moved.any():
+            return
+
+        cells = np.unique(np.concatenate((old[moved], new[moved])))
+        before = self.top[cells]
+        self.top[old[moved]] = -1
+        self._cells[ids] = new
+        # Entities that stayed may share a cell with one that left, so every living entity is scattered again
+        self._scatter(ids)
+        self._invalidate(cells[self._looks_differ(before, self.top[cells])])
+
+    def _looks_differ(self, a, b):
+        """Compares what is drawn by two arrays of entity indices, -1 meaning no entity"""
+        differ = (a >= 0) != (b >= 0)
+        both = (a >= 0) & (b >= 0) & (a != b)
+        i, j = a[both], b[both]
+        differ[both] = (self.has_fg[i] != self.has_fg[j]) | (self.has_bg[i] != self.has_bg[j]) | \
+                       (self.fg[i] != self.fg[j]).any(axis=1) | (self.bg[i] != self.bg[j]).any(axis=1) | \
+                       (self.text[i] != self.text[j])
+        return differ
+
+    def entity_at(self, position: Position):
+        x = position.x - self.origin.x
+        y = position.y - self.origin.y
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return -1
+        return int(self.top[y * self.width + x])
+
+    def draw(self, entity: int, data: RenderData):
+        if self.has_fg[entity]:
+            data.fg_color = Color(*self.fg[entity].tolist())
+        if self.has_bg[entity]:
+            data.bg_color = Color(*self.bg[entity].tolist())
+        if self.text[entity]:
+            data.text = str(self.text[entity])
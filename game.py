@@ -0,0 +1,57 @@
+from __future__ import annotations
+from basetypes import Map, Camera, Position, Unit, RenderData, Color
+from collectibles import KeyPickup
+from units import DelegateUnit
+
+
+def _player_on_draw(self: Unit, data: RenderData):
+    data.text = "PP"
+    data.bg_color = Color(255, 0, 0)
+
+
+class Game:
+    """The game played by main.py, without any dependency on the terminal
+
+    The camera is optional, without one the game runs headless
+    """
+
+    MOVES = {
+        b'w': Position.UP,
+        b's': Position.DOWN,
+        b'a': Position.LEFT,
+        b'd': Position.RIGHT,
+    }
+    CAMERA_MOVES = {
+        b't': Position.UP,
+        b'g': Position.DOWN,
+        b'f': Position.LEFT,
+        b'h': Position.RIGHT,
+    }
+
+    def __init__(self, _map: Map, camera: Camera | None = None):
+        Map.current = _map
+        self.map = _map
+        self.camera = camera
+        self.ticks = 0
+        self.player = DelegateUnit(fon_draw=_player_on_draw)
+        _map.try_spawn_unit(self.player, _map.tile_at(Position(1, 1)))
+        _map.try_spawn_unit(KeyPickup(), _map.tile_at(Position(5, 1)))
+
+    def tick(self):
+        self.map.tick()
+        self.ticks += 1
+
+    def handle(self, inp: bytes):
+        """Handles a single key press
+
+        :param bytes inp: The key as returned by :meth:`Utils.getch`
+        :returns: False if the game should exit, True otherwise
+        :rtype: bool
+        """
+        if inp == b'\x03':  # If we receive ETX (End of Text) we exit
+            return False
+        elif inp in Game.MOVES:
+            self.map.try_move_unit(self.player, self.player.position + Game.MOVES[inp])
+        elif inp in Game.CAMERA_MOVES and self.camera:
+            self.camera.origin += Game.CAMERA_MOVES[inp]
+        return True
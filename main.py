@@ -1,59 +1,90 @@
 from __future__ import annotations
-from platform import system
-from sys import exit, stdout
-from basetypes import *
+from startup import StartupTimer
+timer = StartupTimer.from_env()
+
+import atexit
+from argparse import ArgumentParser, ArgumentTypeError
+from sys import exit, platform, stderr, stdout
 import mapping
-from collectibles import KeyPickup
-from termansi import *
-from units import DelegateUnit
+from basetypes import Camera, Position
+from game import Game
+from output import FrameWriter
+from termansi import Utils
+from viewport import Compositor, Viewport
+
+
+def minimap_level(value: str):
+    level = int(value)
+    if level < 0:
+        raise ArgumentTypeError("the minimap level must not be negative")
+    return level
+
+
+parser = ArgumentParser()
+parser.add_argument("--record", metavar="FILE", help="record all key presses into FILE, see replay.py")
+parser.add_argument("--hash", action="store_true", help="record a frame hash after every key press")
+parser.add_argument("--stats", action="store_true", help="print output statistics on exit")
+parser.add_argument("--minimap", metavar="LEVEL", type=minimap_level,
+                    help="show the map downsampled 2^LEVEL times in the right third of the screen")
+args = parser.parse_args()
 
 if not stdout.isatty():
     print("STDOUT is not a terminal")
     exit(1)
 
 # Old windows console is dog poo-poo, enable VT_SEQUENCES
-if system() == "Windows":
+if platform == "win32":
     Utils.vt_seq_win(True)
-
-fwrite(Terminal.erase_screen())
-
-
-def __on_draw(self: Unit, data: RenderData):
-    data.text = "PP"
-    data.bg_color = Color(255, 0, 0)
-
-
-Map.current = mapping.DEBUG_MAP
-player = DelegateUnit(fon_draw=__on_draw)
-key = KeyPickup()
-Map.current.try_spawn_unit(player, Map.current.tile_at(Position(1, 1)))
-Map.current.try_spawn_unit(key, Map.current.tile_at(Position(5, 1)))
+# Raw mode is entered once, switching it for every key would wait until all pending output reached the terminal
+Utils.set_raw(True)
+atexit.register(Utils.set_raw, False)
 
 Camera.current = Camera()
+frustum = Camera.current.frustum
+width = frustum[0] // 2
+main_width = width - width // 3 if args.minimap is not None else width
+compositor = Compositor([Viewport(Camera.current, Position(0, 0), main_width, frustum[1])])
+# Composition stays on this thread, only the writer thread ever blocks on the terminal
+writer = FrameWriter(stdout)
+if timer:
+    def first_frame_written():
+        # Only reached once the first frame was flushed to the terminal, not when it was handed to the writer
+        writer.on_write = None
+        timer.finish()
+
+    writer.on_write = first_frame_written
+game = Game(mapping.DEBUG_MAP, Camera.current)
+minimap_view = None
+if args.minimap is not None:
+    from minimap import Minimap, MinimapView
+    minimap = Minimap(game.map, args.minimap)
+    minimap_view = MinimapView(minimap, args.minimap, Position(main_width, 0), width - main_width, frustum[1],
+                               game.player)
+# Utils.set_raw loaded the back-end, so this is the actual function and not the lazy one
+getch = Utils.getch
+recorder = None
+if args.record:
+    from replay import Recorder
+    recorder = Recorder(game, getch, args.hash)
+    getch = recorder.getch
 
+first_frame = True
 while True:
-    Camera.current.render()
-    Map.current.tick()
+    frame = compositor.compose(game.map, first_frame)
+    if minimap_view:
+        minimap_view.compose(frame, first_frame)
+    writer.submit(frame)
+    first_frame = False
+    game.tick()
 
-    inp = Utils.getch()
-    if inp == b'\x03':  # If we receive ETX (End of Text) we exit with code 0
+    running = game.handle(getch())
+    if recorder:
+        recorder.after_input()
+    if not running:
+        writer.close()
+        if args.stats:
+            print(writer.report(), file=stderr)
+        if recorder:
+            with open(args.record, "wb") as f:
+                recorder.recording.save(f)
         exit(0)
-    elif inp == b'w':
-        Map.current.try_move_unit(player, player.position + Position.UP)
-    elif inp == b's':
-        Map.current.try_move_unit(player, player.position + Position.DOWN)
-    elif inp == b'a':
-        Map.current.try_move_unit(player, player.position + Position.LEFT)
-    elif inp == b'd':
-        Map.current.try_move_unit(player, player.position + Position.RIGHT)
-    elif inp == b't':
-        Camera.current.origin += Position.UP
-    elif inp == b'g':
-        Camera.current.origin += Position.DOWN
-    elif inp == b'f':
-        Camera.current.origin += Position.LEFT
-    elif inp == b'h':
-        Camera.current.origin += Position.RIGHT
-
-
-
@@ -2,12 +2,22 @@ from __future__ import annotations
 from basetypes import Tile, Position, Map
 from tiles import WallTile
 
-DEBUG_MAP = {}
-for x in range(10):
-    for y in range(10):
-        if x == 0 or y == 0 or x == 9 or y == 9:
-            DEBUG_MAP[Position(x, y)] = WallTile()
-        else:
-            DEBUG_MAP[Position(x, y)] = Tile()
-
-DEBUG_MAP = Map(DEBUG_MAP)
+
+def debug_map():
+    tiles = {}
+    for x in range(10):
+        for y in range(10):
+            if x == 0 or y == 0 or x == 9 or y == 9:
+                tiles[Position(x, y)] = WallTile()
+            else:
+                tiles[Position(x, y)] = Tile()
+
+    return Map(tiles)
+
+
+def __getattr__(name: str):
+    # DEBUG_MAP is only built once something uses it
+    if name == "DEBUG_MAP":
+        value = globals()["DEBUG_MAP"] = debug_map()
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,204 @@
+from __future__ import annotations
+from typing import Dict, List, Set, Tuple
+from basetypes import Color, Map, Position, RenderData, Tile, Unit
+from output import Frame
+from viewport import BLANK
+
+# Blocks are keyed by plain tuples, hashing them is several times faster than hashing positions
+Block = Tuple[int, int]
+Counts = Dict[Color, int]
+
+
+class Minimap:
+    """Downsampled copies of a whole map, kept up to date cell by cell
+
+    Level 0 holds the color of every cell, level n holds one color for every block of 2^n by 2^n cells:
+    the color most cells of the block have. Every level counts the colors of each of its blocks, so a changed
+    cell only touches one block per level and nothing is ever rebuilt. Changes are reported through
+    :meth:`Map.invalidate` and resolved on the next :meth:`refresh`, so a cell changing many times per frame
+    is composed once
+
+    :param Map _map: The map to downsample, the minimap attaches itself to it
+    :param int levels: Amount of downsampled levels besides the full resolution one (default 4)
+    """
+
+    def __init__(self, _map: Map, levels: int = 4):
+        self.map = _map
+        self.levels = levels
+        self.views: List[MinimapView] = []
+        # Dominant color of every block per level, level 0 is the color of the cells themselves
+        self.blocks: List[Dict[Block, Color]] = [{} for _ in range(levels + 1)]
+        # Color counts of every block per level, level 0 needs none
+        self._counts: List[Dict[Block, Counts]] = [{} for _ in range(levels + 1)]
+        self._pending: Set[Position] = set()
+        self._encoded: Dict[Color, str] = {}
+
+        self._build()
+        _map.minimap = self
+
+    def _build(self):
+        """Computes every level at once, each from the counts of the level below"""
+        data = RenderData()
+        cells = self.blocks[0]
+        for pos, tile in self.map.tiles.items():
+            color = Minimap.color_of(tile, data)
+            if color is not None:
+                cells[pos.x, pos.y] = color
+
+        below: Dict[Block, Counts] = {cell: {color: 1} for cell, color in cells.items()}
+        for level in range(1, self.levels + 1):
+            counts: Dict[Block, Counts] = {}
+            for (x, y), children in below.items():
+                block = counts.get((x >> 1, y >> 1))
+                if block is None:
+                    block = counts[x >> 1, y >> 1] = {}
+                for color, n in children.items():
+                    block[color] = block.get(color, 0) + n
+            self._counts[level] = counts
+            self.blocks[level] = {pos: Minimap.dominant(block) for pos, block in counts.items()}
+            below = counts
+
+    @staticmethod
+    def dominant(counts: Counts):
+        """Most common color of a block, ties go to the smallest color so the result never depends on history"""
+        return min(counts, key=lambda color: (-counts[color], color))
+
+    @staticmethod
+    def color_of(tile: Tile | None, data: RenderData):
+        """Color a cell is shown with on the minimap, its background or else its foreground"""
+        if not tile:
+            return None
+        RenderData.compose(tile, data)
+        return data.bg_color or data.fg_color
+
+    def invalidate(self, position: Position):
+        self._pending.add(position)
+
+    def refresh(self):
+        """Applies every cell invalidated since the last refresh"""
+        if self.map.entities:
+            self.map.entities.flush()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, set()
+        data = RenderData()
+        for pos in pending:
+            self._set(pos, Minimap.color_of(self.map.tile_at(pos), data))
+
+    def _set(self, position: Position, color: Color | None):
+        cell = (position.x, position.y)
+        old = self.blocks[0].get(cell)
+        if old == color:
+            return
+
+        if color is None:
+            del self.blocks[0][cell]
+        else:
+            self.blocks[0][cell] = color
+        self._changed(0, cell)
+        for level in range(1, self.levels + 1):
+            block = (position.x >> level, position.y >> level)
+            counts = self._counts[level].setdefault(block, {})
+            if old is not None:
+                counts[old] -= 1
+                if not counts[old]:
+                    del counts[old]
+            if color is not None:
+                counts[color] = counts.get(color, 0) + 1
+
+            blocks = self.blocks[level]
+            before = blocks.get(block)
+            if counts:
+                blocks[block] = Minimap.dominant(counts)
+            else:
+                del self._counts[level][block]
+                blocks.pop(block, None)
+            if blocks.get(block) != before:
+                self._changed(level, block)
+
+    def _changed(self, level: int, block: Block):
+        for view in self.views:
+            if view.level == level:
+                view.changed.add(block)
+
+    def color_at(self, block: Position, level: int):
+        """Dominant color of a block, None if none of its cells has a color"""
+        return self.blocks[level].get((block.x, block.y))
+
+    def encode(self, color: Color | None):
+        if color is None:
+            return BLANK
+        cell = self._encoded.get(color)
+        if cell is None:
+            cell = self._encoded[color] = RenderData.encode(RenderData(bg_color=color))
+        return cell
+
+
+class MinimapView:
+    """A level of a minimap drawn into a rectangle of the screen, for example next to a :class:`Viewport`
+
+    Every block takes up one tile sized cell, so drawing a view costs as much as drawing a viewport of the same size
+    no matter how much of the map it covers. After the first frame only blocks whose color changed are drawn
+
+    :param Minimap minimap: The minimap to draw, the view registers itself with it
+    :param int level: Drawn level, every cell shows a block of 2^level by 2^level tiles
+    :param Position offset: Top left corner of the rectangle on screen
+    :param int width: Width of the rectangle in cells
+    :param int height: Height of the rectangle in cells
+    :param Unit|None follow: Unit the view is kept centered on
+    :except ValueError: If the minimap has no such level
+    """
+
+    def __init__(self, minimap: Minimap, level: int, offset: Position, width: int, height: int,
+                 follow: Unit | None = None):
+        if not 0 <= level <= minimap.levels:
+            raise ValueError(f"Level must be between 0 and {minimap.levels}")
+
+        self.minimap = minimap
+        self.level = level
+        self.offset = offset
+        self.width = width
+        self.height = height
+        self.follow = follow
+        # Block shown in the top left corner
+        self.origin = Position(0, 0)
+        self.changed: Set[Block] = set()
+        # Set when the whole view has to be redrawn on the next frame
+        self.invalidated = True
+        minimap.views.append(self)
+
+    def close(self):
+        self.minimap.views.remove(self)
+
+    def update(self):
+        if self.follow and self.follow.position:
+            pos = self.follow.position
+            origin = Position((pos.x >> self.level) - self.width // 2, (pos.y >> self.level) - self.height // 2)
+            if origin != self.origin:
+                self.origin = origin
+                self.invalidated = True
+
+    def screen_position(self, block: Position):
+        """Terminal cursor position of a block, 1-based column and row"""
+        actual = block - self.origin + self.offset
+        return actual.x * 2 + 1, actual.y + 1
+
+    def compose(self, frame: Frame, force=False):
+        """Adds the blocks that have to be drawn to a frame, usually one built by :meth:`Compositor.compose`"""
+        minimap = self.minimap
+        minimap.refresh()
+        self.update()
+        left, top = self.origin.x, self.origin.y
+        if force or self.invalidated:
+            blocks = [(x, y) for y in range(top, top + self.height) for x in range(left, left + self.width)]
+        else:
+            blocks = [(x, y) for x, y in self.changed
+                      if left <= x < left + self.width and top <= y < top + self.height]
+        self.invalidated = False
+        self.changed.clear()
+
+        colors = minimap.blocks[self.level]
+        cells = frame.cells
+        dx, dy = self.offset.x - left, self.offset.y - top
+        for x, y in blocks:
+            cells[(x + dx) * 2 + 1, y + dy + 1] = minimap.encode(colors.get((x, y)))
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import sys
+from threading import Condition, Thread
+from time import perf_counter
+from typing import Callable, Dict, Tuple, TextIO
+from termansi import GraphicMode, Terminal
+
+
+class Frame:
+    """Cells to be written to the terminal, keyed by their 1-based column and row
+
+    :param bool clear: Whether the screen is erased before drawing the cells
+    """
+
+    def __init__(self, clear: bool = False):
+        self.clear = clear
+        self.cells: Dict[Tuple[int, int], str] = {}
+
+    def merge(self, newer: Frame):
+        """Adds a newer frame on top of this one, so writing this frame shows the same as writing both"""
+        if newer.clear:
+            self.clear = True
+            self.cells = dict(newer.cells)
+        else:
+            self.cells.update(newer.cells)
+
+    def encode(self):
+        parts = [GraphicMode.RESET + Terminal.erase_screen()] if self.clear else []
+        for (col, row), cell in self.cells.items():
+            parts.append(Terminal.move_position(col, row))
+            parts.append(cell)
+        parts.append(Terminal.MOVE_HOME)
+        return "".join(parts)
+
+
+class FrameWriter:
+    """Owns an output file and writes frames to it on its own thread
+
+    :meth:`submit` never blocks. If the previous frame is still waiting to be written, the new frame is merged into it
+    and counted as dropped, so a slow terminal only ever gets the latest state instead of a growing backlog
+
+    :param TextIO|None file: The output file (default STDOUT)
+    :param Callable[[],None]|None on_write: Called on the writer thread after every frame was flushed
+    """
+
+    def __init__(self, file: TextIO | None = None, on_write: Callable[[], None] | None = None):
+        self.file = file or sys.stdout
+        self.on_write = on_write
+        self.written = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._pending: Frame | None = None
+        self._submitted = 0.0
+        self._closed = False
+        self._condition = Condition()
+        self._thread = Thread(target=self._run, name="FrameWriter", daemon=True)
+        self._thread.start()
+
+    @property
+    def latency_avg(self):
+        return self.latency_total / self.written if self.written else 0.0
+
+    def submit(self, frame: Frame):
+        if not frame.clear and not frame.cells:
+            return
+        with self._condition:
+            if self._pending is not None:
+                self._pending.merge(frame)
+                self.dropped += 1
+            else:
+                self._pending = frame
+                self._submitted = perf_counter()
+                self._condition.notify()
+
+    def close(self):
+        """Writes the pending frame and stops the thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def report(self):
+        return (f"{self.written} frames written, {self.dropped} dropped, flush latency "
+                f"avg {self.latency_avg * 1000:.2f}ms max {self.latency_max * 1000:.2f}ms")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                frame, submitted = self._pending, self._submitted
+                self._pending = None
+
+            self.file.write(frame.encode())
+            self.file.flush()
+            # Measured from the oldest state the frame contains, dropped frames included
+            latency = perf_counter() - submitted
+            self.written += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if self.on_write:
+                self.on_write()
+
+
+_BLOCKED_OUTPUT = """
+import sys
+from output import Frame, FrameWriter
+from termansi import Utils
+Utils.set_raw(True)
+writer = FrameWriter(sys.stdout)
+with open(sys.argv[1], "w", buffering=1) as report:
+    while True:
+        frame = Frame()
+        frame.cells = {(col, row): "##" for col in range(1, 160, 2) for row in range(1, 1000)}
+        writer.submit(frame)
+        key = Utils.getch()
+        report.write(key.decode() + "\\n")
+        if key == b"q":
+            break
+Utils.set_raw(False)
+"""
+
+if __name__ == "__main__":
+    # Checks that keys are read promptly and none are lost while the terminal does not accept any output
+    import os
+    import pty
+    import tempfile
+    from time import sleep
+
+    path = os.path.join(tempfile.mkdtemp(), "keys")
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        os.execv(sys.executable, [sys.executable, "-c", _BLOCKED_OUTPUT, path])
+
+    def received():
+        try:
+            with open(path) as f:
+                return f.read().split()
+        except FileNotFoundError:
+            return []
+
+    # The output of the child is never read, so the terminal stays congested for the whole check
+    sleep(1)
+    worst = 0.0
+    keys = "abcdefgh"
+    for i, key in enumerate(keys):
+        os.write(fd, key.encode())
+        start = perf_counter()
+        while len(received()) <= i and perf_counter() - start < 5:
+            sleep(0.001)
+        worst = max(worst, perf_counter() - start)
+    got = received()
+    os.write(fd, b"q")
+    os.kill(pid, 9)
+    os.waitpid(pid, 0)
+    print(f"received {''.join(got)!r} of {keys!r}, slowest key took {worst * 1000:.1f}ms")
+    sys.exit(0 if got == list(keys) and worst < 0.5 else 1)
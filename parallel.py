@@ -0,0 +1,357 @@
+from __future__ import annotations
+import os
+import pickle
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from struct import Struct
+from typing import Dict, List, NamedTuple, Tuple, Iterable
+from basetypes import Map, Position, Tile, Unit, RenderData, Color, Camera, Layer
+from termansi import fwrite, GraphicMode, Terminal
+from workers import WorkerPool, serve
+
+# A move that crosses a region boundary: (source, target, id of the unit in its source worker, pickled unit)
+BoundaryMove = Tuple[Position, Position, int, bytes]
+# A unit crossing a boundary is identified by its source position and its id in the source worker
+Crossing = Tuple[Position, int]
+# A rejected boundary move: the crossing and the pickled unit that blocked it
+Contact = Tuple[Position, int, bytes]
+
+
+class Region(NamedTuple):
+    """Rectangular part of a map owned by a single worker"""
+    x: int
+    y: int
+    width: int
+    height: int
+
+    def contains(self, position: Position):
+        return self.x <= position.x < self.x + self.width and self.y <= position.y < self.y + self.height
+
+    @staticmethod
+    def partition(origin: Position, size: Tuple[int, int], columns: int, rows: int) -> List[Region]:
+        """Splits a rectangle into a grid of regions
+
+        :param Position origin: Top left corner of the rectangle
+        :param Tuple[int,int] size: Width and height of the rectangle
+        :param int columns: Amount of regions along the X axis
+        :param int rows: Amount of regions along the Y axis
+        :returns: List of all non-empty regions in row-major order
+        :rtype: List[Region]
+        """
+        step_x = -(-size[0] // columns)
+        step_y = -(-size[1] // rows)
+        regions = []
+        for y in range(origin.y, origin.y + size[1], step_y):
+            for x in range(origin.x, origin.x + size[0], step_x):
+                regions.append(Region(x, y, min(step_x, origin.x + size[0] - x), min(step_y, origin.y + size[1] - y)))
+        return regions
+
+
+class CellBuffer:
+    """Fixed size render records of every cell of a map, stored in shared memory
+
+    Every record is 16 bytes: flags, foreground and background color and up to two code points of text
+    """
+
+    RECORD: Struct = Struct("<B3B3BxII")
+    HAS_FG = 1
+    HAS_BG = 2
+
+    def __init__(self, origin: Position, size: Tuple[int, int], name: str | None = None):
+        self.origin = origin
+        self.size = size
+        length = size[0] * size[1] * CellBuffer.RECORD.size
+        self.memory = SharedMemory(name, create=name is None, size=length)
+
+    def index(self, position: Position):
+        return (position.y - self.origin.y) * self.size[0] + position.x - self.origin.x
+
+    def position(self, index: int):
+        return Position(self.origin.x + index % self.size[0], self.origin.y + index // self.size[0])
+
+    def write(self, index: int, data: RenderData):
+        flags = (CellBuffer.HAS_FG if data.fg_color else 0) | (CellBuffer.HAS_BG if data.bg_color else 0)
+        fg = data.fg_color or (0, 0, 0)
+        bg = data.bg_color or (0, 0, 0)
+        text = (data.text or "")[:2].ljust(2, "\0")
+        CellBuffer.RECORD.pack_into(self.memory.buf, index * CellBuffer.RECORD.size,
+                                    flags, *fg, *bg, ord(text[0]), ord(text[1]))
+
+    def read(self, index: int):
+        flags, fr, fg, fb, br, bg, bb, t0, t1 = CellBuffer.RECORD.unpack_from(self.memory.buf,
+                                                                               index * CellBuffer.RECORD.size)
+        data = RenderData()
+        data.fg_color = Color(fr, fg, fb) if flags & CellBuffer.HAS_FG else None
+        data.bg_color = Color(br, bg, bb) if flags & CellBuffer.HAS_BG else None
+        data.text = "".join(chr(c) for c in (t0, t1) if c) or None
+        return data
+
+    def close(self, unlink: bool = False):
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class RegionMap(Map):
+    """The part of a map simulated by a single worker
+
+    Moves into tiles owned by other workers are not applied, they are collected into the outbox instead
+    and resolved by :meth:`ParallelMap.tick` once every worker finished its tick
+
+    ----
+
+    Units only meet across a boundary as copies: when a boundary move is blocked, both units get their
+    :meth:`Unit.on_contact` call, but each one is handed a copy of the other
+    """
+
+    def __init__(self, tiles: Dict[Position, Tile]):
+        super().__init__(tiles)
+        self.outbox: List[BoundaryMove] = []
+        self._leaving: set[int] = set()
+        self._arrived: Dict[Crossing, Unit] = {}
+
+    def try_move_unit(self, unit: Unit, position: Position):
+        # A unit waiting to cross a boundary stays where it is until the move is resolved
+        if id(unit) in self._leaving:
+            return False
+        if unit.position != position and position not in self.tiles:
+            self._leaving.add(id(unit))
+            self.outbox.append((unit.position, position, id(unit), _dumps_unit(unit)))
+            return False
+
+        return super().try_move_unit(unit, position)
+
+    def clear_outbox(self):
+        self.outbox.clear()
+        self._leaving.clear()
+        self._arrived.clear()
+
+    def accept(self, moves: Iterable[BoundaryMove]):
+        """Applies boundary moves targeting this region, in order
+
+        :returns: The crossings of all accepted moves and the contacts of all moves blocked by a unit
+        :rtype: Tuple[List[Crossing],List[Contact]]
+        """
+        accepted = []
+        contacts = []
+        for source, target, token, payload in moves:
+            tile = self.tiles[target]
+            unit = pickle.loads(payload)
+            if unit.layer == Layer.UNITS and tile.unit:
+                contacts.append((source, token, _dumps_unit(tile.unit)))
+                tile.unit.on_contact(unit)
+                continue
+            if not tile.can_enter(unit):
+                continue
+
+            tile.add(unit)
+            tile.on_enter(unit)
+            unit.on_enter(tile)
+            Map.touch_units(unit, tile)
+            self._arrived[source, token] = unit
+            accepted.append((source, token))
+        return accepted, contacts
+
+    def _leaving_unit(self, source: Position, token: int):
+        tile = self.tiles[source]
+        return next((u for u in tile.units if id(u) == token), None)
+
+    def commit(self, accepted: Iterable[Crossing], contacts: Iterable[Contact]):
+        """Removes units that were accepted by another region and delivers the contacts of blocked moves
+
+        Units may have been removed while the other regions accepted them, for example by a contact
+
+        :returns: Crossings whose unit no longer exists, their copies have to be revoked
+        :rtype: List[Crossing]
+        """
+        for source, token, payload in contacts:
+            unit = self._leaving_unit(source, token)
+            if unit:
+                unit.on_contact(pickle.loads(payload))
+
+        missing = []
+        for source, token in accepted:
+            unit = self._leaving_unit(source, token)
+            if not unit:
+                missing.append((source, token))
+                continue
+            tile = unit.tile
+            tile.remove(unit)
+            tile.on_leave(unit)
+            unit.on_leave(tile)
+        return missing
+
+    def revoke(self, crossings: Iterable[Crossing]):
+        """Removes accepted copies of units that were removed from their source region before the commit"""
+        for crossing in crossings:
+            unit = self._arrived.pop(crossing, None)
+            if unit and unit.tile:
+                unit.tile.remove(unit)
+
+
+def _dumps_unit(unit: Unit):
+    # The tile stays behind, only the unit itself crosses the boundary
+    tile = unit.tile
+    unit.tile = None
+    try:
+        return pickle.dumps(unit)
+    finally:
+        unit.tile = tile
+
+
+def _worker(conn: Connection, tiles: Dict[Position, Tile], origin: Position, size: Tuple[int, int], name: str):
+    region = RegionMap(tiles)
+    cells = CellBuffer(origin, size, name)
+    Map.current = region
+
+    data = RenderData()
+
+    def flush():
+        changed = []
+        for tile in region.tiles.values():
+            if tile.needs_redraw:
+                index = cells.index(tile.position)
+                cells.write(index, RenderData.compose(tile, data))
+                changed.append(index)
+                tile.clean()
+        return changed
+
+    def handle(command: str, args):
+        if command == "tick":
+            region.clear_outbox()
+            for source, target in args:
+                tile = region.tiles.get(source)
+                if tile and tile.unit:
+                    region.try_move_unit(tile.unit, target)
+            region.tick()
+            return list(region.outbox), flush()
+        elif command == "accept":
+            return (*region.accept(args), flush())
+        elif command == "commit":
+            return region.commit(*args), flush()
+        elif command == "revoke":
+            region.revoke(args)
+            return flush()
+        raise ValueError(f"Unknown command {command}")
+
+    try:
+        serve(conn, handle)
+    finally:
+        cells.close()
+
+
+class ParallelMap:
+    """Simulates a map on a pool of worker processes
+
+    The map is split into rectangular regions which are distributed between the workers. Each worker ticks its
+    regions in parallel, moves crossing a region boundary are merged in a deterministic order afterwards.
+    Workers write the render data of changed cells into a shared :class:`CellBuffer`, which is then drawn by
+    :meth:`render`.
+
+    ----
+
+    Once started, the workers own the tiles and units. The map passed in is not updated, all changes to the
+    simulation have to go through :meth:`move`
+    """
+
+    def __init__(self, _map: Map, workers: int | None = None, columns: int | None = None, rows: int | None = None):
+        self.origin, width, height = _map.bounds()
+        self.size = (width, height)
+        self.workers = workers or os.cpu_count() or 1
+        self.regions = Region.partition(self.origin, self.size, columns or self.workers, rows or 1)
+        self.map = _map
+        self.cells: CellBuffer | None = None
+        self._owner: Dict[Position, int] = {}
+        self._pool = WorkerPool()
+        self._moves: List[List[Tuple[Position, Position]]] = []
+        self._changed: set[int] = set()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self.cells = CellBuffer(self.origin, self.size)
+        owned: List[Dict[Position, Tile]] = [{} for _ in range(self.workers)]
+        for pos, tile in self.map.tiles.items():
+            for i, region in enumerate(self.regions):
+                if region.contains(pos):
+                    worker = i % self.workers
+                    owned[worker][pos] = tile
+                    self._owner[pos] = worker
+                    break
+
+        for tiles in owned:
+            self._pool.start(_worker, tiles, self.origin, self.size, self.cells.memory.name)
+            self._moves.append([])
+        self._changed.update(self.cells.index(pos) for pos in self._owner)
+
+    def close(self):
+        self._pool.close()
+        if self.cells:
+            self.cells.close(True)
+            self.cells = None
+
+    def move(self, source: Position, target: Position):
+        """Queues a move of the unit at source, it is applied at the start of the next tick"""
+        if source in self._owner:
+            self._moves[self._owner[source]].append((source, target))
+
+    def tick(self):
+        results = self._pool.exchange([("tick", moves) for moves in self._moves])
+        for moves in self._moves:
+            moves.clear()
+
+        # Merge boundary moves deterministically, independent of which worker finished first
+        boundary = sorted((move for outbox, _ in results for move in outbox
+                           if move[1] in self._owner),
+                          key=lambda m: (m[1].y, m[1].x, m[0].y, m[0].x))
+        offers: List[List[BoundaryMove]] = [[] for _ in range(self.workers)]
+        for move in boundary:
+            offers[self._owner[move[1]]].append(move)
+
+        commits: List[List[Crossing]] = [[] for _ in range(self.workers)]
+        contacts: List[List[Contact]] = [[] for _ in range(self.workers)]
+        targets: Dict[Crossing, int] = {}
+        if boundary:
+            accepting = [i for i in range(self.workers) if offers[i]]
+            answers = self._pool.exchange([("accept", moves) for moves in offers], offers)
+            for i, (accepted, blocked, changed) in zip(accepting, answers):
+                self._changed.update(changed)
+                for crossing in accepted:
+                    commits[self._owner[crossing[0]]].append(crossing)
+                    targets[crossing] = i
+                for contact in blocked:
+                    contacts[self._owner[contact[0]]].append(contact)
+
+        revokes: List[List[Crossing]] = [[] for _ in range(self.workers)]
+        committing = [units or blocked for units, blocked in zip(commits, contacts)]
+        if any(committing):
+            for missing, changed in self._pool.exchange(
+                    [("commit", (units, blocked)) for units, blocked in zip(commits, contacts)], committing):
+                self._changed.update(changed)
+                for crossing in missing:
+                    revokes[targets[crossing]].append(crossing)
+        if any(revokes):
+            for changed in self._pool.exchange([("revoke", crossings) for crossings in revokes], revokes):
+                self._changed.update(changed)
+
+        for _, changed in results:
+            self._changed.update(changed)
+
+    def render(self, camera: Camera, force=False):
+        force = force or camera.invalidated
+        camera.invalidated = False
+        if force:
+            fwrite(GraphicMode.RESET, Terminal.erase_screen())
+            self._changed.update(self.cells.index(pos) for pos in self._owner)
+
+        for index in self._changed:
+            pos = self.cells.position(index)
+            if camera.is_visible(pos):
+                RenderData.render(pos + camera.origin, self.cells.read(index))
+        self._changed.clear()
+        fwrite(Terminal.MOVE_HOME)
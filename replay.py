@@ -0,0 +1,141 @@
+from __future__ import annotations
+import hashlib
+import sys
+from struct import Struct
+from time import perf_counter
+from typing import BinaryIO, Callable, List, NamedTuple, Tuple
+from basetypes import Map, RenderData
+from game import Game
+
+# A single recorded key press: (tick, key, frame hash or None)
+Entry = Tuple[int, bytes, bytes | None]
+
+
+def frame_hash(_map: Map):
+    """Hashes what the map would look like if rendered, without touching the terminal
+
+    :returns: 16 byte digest of the position and render data of every tile
+    :rtype: bytes
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    data = RenderData()
+    for pos, tile in _map.tiles.items():
+        RenderData.compose(tile, data)
+        digest.update(f"{pos.x},{pos.y},{data.fg_color},{data.bg_color},{data.text};".encode())
+    return digest.digest()
+
+
+class Recording:
+    """Input stream of a game session, with the tick every key was read on"""
+
+    MAGIC = b"PKRR"
+    ENTRY: Struct = Struct("<IBB")
+    HASH_SIZE = 16
+
+    def __init__(self, entries: List[Entry] | None = None):
+        self.entries: List[Entry] = entries or []
+
+    def add(self, tick: int, inp: bytes, _hash: bytes | None = None):
+        self.entries.append((tick, inp, _hash))
+
+    def save(self, file: BinaryIO):
+        file.write(Recording.MAGIC)
+        for tick, inp, _hash in self.entries:
+            file.write(Recording.ENTRY.pack(tick, len(inp), _hash is not None))
+            file.write(inp)
+            if _hash is not None:
+                file.write(_hash)
+
+    @staticmethod
+    def load(file: BinaryIO):
+        """Reads a recording written by :meth:`save`
+
+        :except ValueError: If the file is not a recording
+        """
+        if file.read(len(Recording.MAGIC)) != Recording.MAGIC:
+            raise ValueError("File is not a recording")
+
+        recording = Recording()
+        while header := file.read(Recording.ENTRY.size):
+            tick, length, hashed = Recording.ENTRY.unpack(header)
+            inp = file.read(length)
+            recording.add(tick, inp, file.read(Recording.HASH_SIZE) if hashed else None)
+        return recording
+
+
+class Recorder:
+    """Wraps a getch function, recording every key it returns
+
+    :param Game game: The game whose ticks are recorded
+    :param Callable[[],bytes] getch: The wrapped function, usually :meth:`Utils.getch`
+    :param bool hashed: Whether to record a frame hash after every key, see :meth:`after_input`
+    """
+
+    def __init__(self, game: Game, getch: Callable[[], bytes], hashed: bool = False):
+        self.game = game
+        self.recording = Recording()
+        self.hashed = hashed
+        self._getch = getch
+        self._pending: bytes | None = None
+
+    def getch(self):
+        self._pending = self._getch()
+        return self._pending
+
+    def after_input(self):
+        """Records the last key, must be called once the game handled it"""
+        if self._pending is not None:
+            self.recording.add(self.game.ticks, self._pending, frame_hash(self.game.map) if self.hashed else None)
+            self._pending = None
+
+
+class ReplayResult(NamedTuple):
+    ticks: int
+    inputs: int
+    seconds: float
+    divergence: int | None
+
+    @property
+    def ticks_per_second(self):
+        return self.ticks / self.seconds if self.seconds else float("inf")
+
+
+def replay(recording: Recording, game: Game, verify: bool = True):
+    """Replays a recording against a headless game as fast as possible
+
+    :param Recording recording: The inputs to replay
+    :param Game game: A freshly created game, set up the same way as the recorded one
+    :param bool verify: Whether to compare recorded frame hashes, stops at the first mismatch
+    :returns: Timing of the replay and the tick of the first divergence, if any
+    :rtype: ReplayResult
+    """
+    start = perf_counter()
+    inputs = 0
+    divergence = None
+    for tick, inp, _hash in recording.entries:
+        while game.ticks < tick:
+            game.tick()
+        inputs += 1
+        if not game.handle(inp):
+            break
+        if verify and _hash is not None and frame_hash(game.map) != _hash:
+            divergence = tick
+            break
+
+    return ReplayResult(game.ticks, inputs, perf_counter() - start, divergence)
+
+
+if __name__ == "__main__":
+    import mapping
+
+    if len(sys.argv) != 2:
+        print("Usage: replay.py <recording>")
+        sys.exit(2)
+
+    with open(sys.argv[1], "rb") as f:
+        result = replay(Recording.load(f), Game(mapping.debug_map()))
+    print(f"{result.inputs} inputs, {result.ticks} ticks in {result.seconds:.4f}s "
+          f"({result.ticks_per_second:.0f} ticks/s)")
+    if result.divergence is not None:
+        print(f"Diverged at tick {result.divergence}")
+        sys.exit(1)
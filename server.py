@@ -0,0 +1,280 @@
+from __future__ import annotations
+import selectors
+import socket
+import sys
+from time import monotonic
+from typing import Dict, List, Set
+from basetypes import Camera, Color, Map, Position, RenderData, Unit
+from game import Game
+from termansi import GraphicMode, Terminal
+from viewport import BLANK
+
+# Telnet commands, see RFC 854, 857, 858 and 1073
+IAC = 255
+DONT, DO, WONT, WILL = 254, 253, 252, 251
+SB, SE = 250, 240
+ECHO, SGA, NAWS = 1, 3, 31
+NEGOTIATION = bytes([IAC, WILL, ECHO, IAC, WILL, SGA, IAC, DO, NAWS])
+
+
+class RemotePlayer(Unit):
+    def __init__(self, color: Color):
+        super().__init__()
+        self.color = color
+
+    def on_draw(self, data: RenderData):
+        data.text = "PP"
+        data.bg_color = self.color
+
+
+class Client:
+    """A connected terminal with its own camera and copy of what its screen currently shows
+
+    :param socket.socket sock: Non-blocking socket of the client
+    :param Position origin: Initial origin of the camera
+    """
+
+    DEFAULT_SIZE = (80, 24)
+
+    def __init__(self, sock: socket.socket, origin: Position = Position(0, 0)):
+        self.sock = sock
+        self.camera = Camera(origin, Client.DEFAULT_SIZE)
+        self.player: RemotePlayer | None = None
+        # Screen position -> encoded cell the client is known to display
+        self.framebuffer: Dict[Position, str] = {}
+        # Set when every cell on screen has to be compared on the next frame, not only the changed ones
+        self.rescan = True
+        self.outgoing = bytearray(NEGOTIATION + (GraphicMode.RESET + Terminal.erase_screen()).encode())
+        self.dropped_frames = 0
+        self._telnet = bytearray()
+
+    @property
+    def size(self):
+        """Size of the client screen in tiles"""
+        return self.camera.frustum[0] // 2, self.camera.frustum[1]
+
+    def resize(self, columns: int, rows: int):
+        self.camera.frustum = (columns, rows)
+        self.invalidate()
+
+    def invalidate(self):
+        self.framebuffer.clear()
+        self.rescan = True
+        self.outgoing += (GraphicMode.RESET + Terminal.erase_screen()).encode()
+
+    def feed(self, data: bytes) -> bytes:
+        """Strips telnet commands from received data, handling window size reports
+
+        :returns: The keys typed by the client
+        :rtype: bytes
+        """
+        self._telnet += data
+        keys = bytearray()
+        buf = self._telnet
+        i = 0
+        while i < len(buf):
+            if buf[i] != IAC:
+                keys.append(buf[i])
+                i += 1
+                continue
+            if i + 1 >= len(buf):
+                break
+            command = buf[i + 1]
+            if command == IAC:
+                keys.append(IAC)
+                i += 2
+            elif command in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(buf):
+                    break
+                i += 3
+            elif command == SB:
+                end = buf.find(bytes([IAC, SE]), i)
+                if end < 0:
+                    break
+                option = buf[i + 2:end]
+                if len(option) == 5 and option[0] == NAWS:
+                    self.resize(option[1] << 8 | option[2], option[3] << 8 | option[4])
+                i = end + 2
+            else:
+                i += 2
+        del buf[:i]
+        return bytes(keys)
+
+
+class Server:
+    """Serves a single map to any number of telnet clients
+
+    Every client has its own camera and framebuffer, only cells that differ from what the client displays are sent.
+    Positions invalidated on the map are collected between frames, so a frame only looks at the changed cells
+    inside each view, the whole screen is only compared for new, resized or scrolled clients. Encoded cells are
+    shared between all clients looking at the same part of the map. Sockets are never blocked on, a client that
+    can not keep up gets its frames dropped until its pending output drains
+
+    :param Map _map: The map to serve
+    :param str host: Address to listen on (default loopback)
+    :param int port: Port to listen on, 0 picks a free one
+    """
+
+    MAX_PENDING = 64 * 1024
+    COLORS = [Color(255, 0, 0), Color(0, 0, 255), Color(255, 0, 255), Color(0, 200, 200), Color(255, 150, 0)]
+
+    def __init__(self, _map: Map, host: str = "127.0.0.1", port: int = 0):
+        Map.current = _map
+        self.map = _map
+        self.clients: List[Client] = []
+        self.selector = selectors.DefaultSelector()
+        self.listener = socket.create_server((host, port))
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        # World position -> encoded cell, dropped once the position is invalidated
+        self._cells: Dict[Position, str] = {}
+        self._changed: Set[Position] = set()
+        _map.listeners.append(self._invalidate)
+
+    @property
+    def address(self):
+        return self.listener.getsockname()
+
+    def close(self):
+        for client in list(self.clients):
+            self.disconnect(client)
+        self.map.listeners.remove(self._invalidate)
+        self.selector.unregister(self.listener)
+        self.listener.close()
+        self.selector.close()
+
+    def serve_forever(self, tick_interval: float = 0.1):
+        next_tick = monotonic()
+        while True:
+            self.poll(max(0.0, next_tick - monotonic()))
+            if monotonic() >= next_tick:
+                next_tick += tick_interval
+                self.map.tick()
+                self.render()
+
+    def poll(self, timeout: float | None = 0):
+        """Accepts new clients, reads input and continues pending writes"""
+        for key, events in self.selector.select(timeout):
+            if key.fileobj is self.listener:
+                self.accept()
+                continue
+
+            client: Client = key.data
+            if events & selectors.EVENT_READ:
+                self.receive(client)
+            if events & selectors.EVENT_WRITE and client in self.clients:
+                self.flush(client)
+
+    def accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = Client(sock)
+        player = RemotePlayer(Server.COLORS[len(self.clients) % len(Server.COLORS)])
+        for tile in self.map.tiles.values():
+            if self.map.try_spawn_unit(player, tile):
+                client.player = player
+                break
+        self.clients.append(client)
+        self.selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+    def disconnect(self, client: Client):
+        if client.player and client.player.tile:
+            self.map.try_remove_unit(client.player)
+        self.clients.remove(client)
+        self.selector.unregister(client.sock)
+        client.sock.close()
+
+    def receive(self, client: Client):
+        try:
+            data = client.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.disconnect(client)
+            return
+
+        for key in client.feed(data):
+            inp = bytes([key])
+            if inp == b'\x03':
+                self.disconnect(client)
+                return
+            elif inp in Game.MOVES and client.player:
+                self.map.try_move_unit(client.player, client.player.position + Game.MOVES[inp])
+            elif inp in Game.CAMERA_MOVES:
+                client.camera.origin += Game.CAMERA_MOVES[inp]
+
+    def flush(self, client: Client):
+        if client.outgoing:
+            try:
+                sent = client.sock.send(client.outgoing)
+                del client.outgoing[:sent]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                self.disconnect(client)
+                return
+
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outgoing else 0)
+        self.selector.modify(client.sock, events, client)
+
+    def _invalidate(self, position: Position):
+        self._changed.add(position)
+
+    def _cell(self, position: Position, data: RenderData):
+        cell = self._cells.get(position)
+        if cell is None:
+            tile = self.map.tile_at(position)
+            cell = self._cells[position] = tile.encode(data) if tile else BLANK
+        return cell
+
+    def render(self):
+        """Sends every client the cells that changed on its screen since its last frame"""
+        if self.map.entities:
+            self.map.entities.flush()
+        changed, self._changed = self._changed, set()
+        for position in changed:
+            self._cells.pop(position, None)
+
+        data = RenderData()
+        for client in list(self.clients):
+            if len(client.outgoing) > Server.MAX_PENDING:
+                # The changes of this frame are never sent, so the next frame has to compare everything
+                client.dropped_frames += 1
+                client.rescan = True
+                continue
+
+            width, height = client.size
+            origin = client.camera.origin
+            if client.rescan or client.camera.invalidated:
+                client.rescan = client.camera.invalidated = False
+                screens = [Position(x, y) for y in range(height) for x in range(width)]
+            else:
+                screens = [screen for screen in (position + origin for position in changed)
+                           if 0 <= screen.x < width and 0 <= screen.y < height]
+
+            frame = []
+            for screen in screens:
+                cell = self._cell(screen - origin, data)
+                if client.framebuffer.get(screen) != cell:
+                    client.framebuffer[screen] = cell
+                    frame += [Terminal.move_position(screen.x * 2 + 1, screen.y + 1), cell]
+            if frame:
+                frame.append(Terminal.MOVE_HOME)
+                client.outgoing += "".join(frame).encode()
+            self.flush(client)
+
+
+if __name__ == "__main__":
+    import mapping
+
+    server = Server(mapping.debug_map(), port=int(sys.argv[1]) if len(sys.argv) > 1 else 2323)
+    print(f"Listening on {server.address[0]}:{server.address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
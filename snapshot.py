@@ -0,0 +1,137 @@
+from __future__ import annotations
+import pickle
+from typing import BinaryIO, Dict, List, Tuple
+from basetypes import Map, Position, Tile, Unit
+
+# State of a single cell: the tile at the position and the units on it
+CellState = Tuple[Tile | None, Tuple[Unit, ...]]
+
+
+class Snapshot:
+    """Copy-on-write snapshot of a map
+
+    Taking a snapshot copies nothing, the original state of a cell is only saved the first time the cell changes,
+    so both taking and rolling back a snapshot cost O(changes)
+    """
+
+    def __init__(self, journal: Journal):
+        self.journal = journal
+        self.cells: Dict[Position, CellState] = {}
+
+    @property
+    def is_open(self):
+        return self in self.journal.snapshots
+
+    def touch(self, position: Position, state: CellState):
+        if position not in self.cells:
+            self.cells[position] = state
+
+    def rollback(self):
+        """Restores the map to the state it was in when the snapshot was taken
+
+        Releases the snapshot and every snapshot taken after it
+
+        :except ValueError: If the snapshot was already released
+        """
+        if not self.is_open:
+            raise ValueError("Snapshot was already released")
+
+        _map = self.journal.map
+        # Detach everything first, units may have moved between the restored cells
+        for pos in self.cells:
+            tile = _map.tile_at(pos)
+            if tile:
+                for unit in tuple(tile.units):
+                    tile.remove(unit)
+        for pos, (tile, units) in self.cells.items():
+            if _map.tile_at(pos) is not tile:
+                if tile:
+                    _map.set_tile(pos, tile)
+                else:
+                    self.journal.record(pos)
+                    _map.tiles.pop(pos).map = None
+                    _map.invalidate(pos)
+            if tile:
+                for unit in tuple(tile.units):
+                    tile.remove(unit)
+                for unit in units:
+                    tile.add(unit)
+
+        self.release()
+
+    def release(self):
+        """Stops recording changes, keeping the current state of the map"""
+        if self.is_open:
+            del self.journal.snapshots[self.journal.snapshots.index(self):]
+
+
+class Journal:
+    """Records every change made to the cells of a map
+
+    Changes are recorded by :meth:`Tile.add`, :meth:`Tile.remove` and :meth:`Map.set_tile`, which covers
+    all :meth:`Map.try_move_unit`, :meth:`Map.try_spawn_unit` and :meth:`Map.try_remove_unit` calls.
+    Besides feeding open snapshots, the journal keeps track of cells changed since the last save,
+    so :meth:`save_delta` only writes what actually changed
+
+    ----
+
+    Only the placement of tiles and units is tracked, state inside a unit is saved whenever its cell changes
+    """
+
+    def __init__(self, _map: Map):
+        self.map = _map
+        self.snapshots: List[Snapshot] = []
+        self.unsaved: set[Position] = set()
+        _map.journal = self
+
+    def record(self, position: Position):
+        self.unsaved.add(position)
+        if self.snapshots:
+            tile = self.map.tile_at(position)
+            state = (tile, tuple(tile.units) if tile else ())
+            for snapshot in self.snapshots:
+                snapshot.touch(position, state)
+
+    def snapshot(self):
+        snapshot = Snapshot(self)
+        self.snapshots.append(snapshot)
+        return snapshot
+
+    def save(self, file: BinaryIO):
+        """Writes the entire map into the file, later deltas can be appended to it using :meth:`save_delta`"""
+        pickle.dump(dict(self.map.tiles), file)
+        self.unsaved.clear()
+
+    def save_delta(self, file: BinaryIO):
+        """Appends all cells changed since the last save to the file
+
+        :returns: The amount of cells written
+        :rtype: int
+        """
+        delta = {pos: self.map.tile_at(pos) for pos in self.unsaved}
+        pickle.dump(delta, file)
+        self.unsaved.clear()
+        return len(delta)
+
+    @staticmethod
+    def load(file: BinaryIO):
+        """Loads a map from a full save followed by any amount of deltas
+
+        :returns: The loaded map with a new journal attached
+        :rtype: Map
+        """
+        tiles: Dict[Position, Tile] = pickle.load(file)
+        while True:
+            try:
+                delta = pickle.load(file)
+            except EOFError:
+                break
+            for pos, tile in delta.items():
+                if tile:
+                    tiles[pos] = tile
+                else:
+                    tiles.pop(pos, None)
+
+        _map = Map(tiles)
+        Journal(_map)
+        return _map
@@ -0,0 +1,141 @@
+from __future__ import annotations
+import os
+import sys
+
+# Only modules the interpreter loads on its own are imported here, so the timer can be created before typing
+from time import perf_counter
+
+ENV_VAR = "PADKAR_STARTUP_REPORT"
+
+
+# Finder and loader are duck typed, importing importlib.abc would cost more than everything it measures
+class _TimedLoader:
+    def __init__(self, loader, timer: StartupTimer, name: str):
+        self._loader = loader
+        self._timer = timer
+        self._name = name
+
+    def __getattr__(self, item):
+        return getattr(self._loader, item)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        timer = self._timer
+        timer._children.append(0.0)
+        start = perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = perf_counter() - start
+            children = timer._children.pop()
+            timer.imports.append((self._name, total - children, total))
+            if timer._children:
+                timer._children[-1] += total
+
+
+class _TimingFinder:
+    def __init__(self, timer: StartupTimer):
+        self.timer = timer
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, self.timer, name)
+            return spec
+        return None
+
+
+class StartupTimer:
+    """Measures how long every import takes and when startup milestones are reached
+
+    Times are measured from the creation of the timer, so it should be created before importing anything else
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        # (module, self time, total time) in the order the imports finished
+        self.imports: list[tuple[str, float, float]] = []
+        self.marks: list[tuple[str, float]] = []
+        self._children: list[float] = []
+        self._finder = _TimingFinder(self)
+        sys.meta_path.insert(0, self._finder)
+
+    @staticmethod
+    def from_env():
+        """Creates a timer if the PADKAR_STARTUP_REPORT environment variable is set
+
+        :returns: The timer or None if reporting is disabled
+        :rtype: StartupTimer|None
+        """
+        return StartupTimer() if os.environ.get(ENV_VAR) else None
+
+    def mark(self, name: str):
+        self.marks.append((name, perf_counter() - self.start))
+
+    def stop(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def report(self, file=None, limit: int = 20):
+        file = file or sys.stderr
+        print(f"{'self ms':>9} {'total ms':>9}  import", file=file)
+        for name, own, total in sorted(self.imports, key=lambda i: i[1], reverse=True)[:limit]:
+            print(f"{own * 1000:9.2f} {total * 1000:9.2f}  {name}", file=file)
+        for name, at in self.marks:
+            print(f"{at * 1000:9.2f} ms  {name}", file=file)
+
+    def finish(self, name: str = "first frame"):
+        """Marks the end of startup and writes the report into the file named by PADKAR_STARTUP_REPORT"""
+        self.mark(name)
+        self.stop()
+        path = os.environ.get(ENV_VAR)
+        if path == "-":
+            self.report()
+        elif path:
+            with open(path, "w") as f:
+                self.report(f)
+
+
+_FIRST_FRAME = """
+from startup import StartupTimer
+timer = StartupTimer()
+import mapping
+from basetypes import Camera, Position
+from game import Game
+from viewport import Compositor, Viewport
+timer.mark("imports")
+game = Game(mapping.DEBUG_MAP)
+timer.mark("map")
+Compositor([Viewport(Camera(frustum=(80, 24)), Position(0, 0), 40, 24)]).compose(game.map, True).encode()
+timer.mark("first frame")
+print(";".join(f"{name}={at}" for name, at in timer.marks))
+"""
+
+if __name__ == "__main__":
+    import subprocess
+    from statistics import median
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    samples: dict[str, list[float]] = {}
+    walls = []
+    for _ in range(runs):
+        start = perf_counter()
+        out = subprocess.run([sys.executable, "-c", _FIRST_FRAME], env=env, capture_output=True, text=True,
+                             check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        walls.append(perf_counter() - start)
+        for pair in out.strip().split(";"):
+            name, at = pair.split("=")
+            samples.setdefault(name, []).append(float(at))
+
+    print(f"Headless startup, median of {runs} runs")
+    for name, values in samples.items():
+        print(f"{median(values) * 1000:9.2f} ms  {name}")
+    print(f"{median(walls) * 1000:9.2f} ms  process wall time")
@@ -1,4 +1,4 @@
-import platform
+import sys
 from typing import Final, Any, Union
 
 
@@ -431,13 +431,27 @@ class Utils:
             data += Utils.getch()
         return int(chr(data[2])), int(chr(data[4]))
 
+    @staticmethod
+    def set_raw(enable: bool = True):
+        """Switches STDIN into raw mode once, instead of for every :meth:`getch`
+
+        Mode changes take effect immediately, they never wait for pending output to reach the terminal
+        and never discard keys that were typed but not read yet
+
+        :param bool enable: Whether to enter raw mode or to restore the mode the terminal had before
+        """
+        _load_backend()
+        Utils.set_raw(enable)
+
     @staticmethod
     def getch() -> bytes:
-        ...
+        _load_backend()
+        return Utils.getch()
 
     @staticmethod
     def is_key_avail() -> bool:
-        ...
+        _load_backend()
+        return Utils.is_key_avail()
 
 
 def fwrite(*values: Any, file: Union[Any, None] = None):
@@ -460,30 +474,59 @@ def combine_modes(*modes: str) -> str:
     return "\x9b" + ';'.join(map(lambda x: x[1:-1], modes)) + "m"
 
 
-# Implement platform specific functions
-if platform.system() == "Windows":
-    import msvcrt
-    Utils.getch = msvcrt.getch
-    Utils.is_key_avail = msvcrt.kbhit
-else:
-    import tty
-    import termios
-    import sys
-    import select
-
-    def _linux_getch():
-        fd = sys.stdin.fileno()
-        old_settings = termios.tcgetattr(fd)
-        try:
-            tty.setraw(sys.stdin.fileno())
-            ch = sys.stdin.read(1)
-        finally:
-            termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-        return ch
-
-    def _linux_is_key_avail():
-        dr, dw, de = select.select([sys.stdin], [], [], 0)
-        return dr != []
-
-    Utils.getch = _linux_getch
-    Utils.is_key_avail = _linux_is_key_avail
+# Implement platform specific functions, the back-end is only imported once it is first used
+_backend_loaded = False
+
+
+def _load_backend():
+    # References to the lazy methods taken before the first call keep calling this, so it has to stay cheap
+    global _backend_loaded
+    if _backend_loaded:
+        return
+    _backend_loaded = True
+    if sys.platform == "win32":
+        import msvcrt
+        Utils.getch = msvcrt.getch
+        Utils.is_key_avail = msvcrt.kbhit
+        # The console already hands over single key presses
+        Utils.set_raw = lambda enable=True: None
+    else:
+        import os
+        import tty
+        import termios
+        import select
+
+        saved = []
+
+        def _linux_set_raw(enable: bool = True):
+            fd = sys.stdin.fileno()
+            if enable and not saved:
+                saved.append(termios.tcgetattr(fd))
+                tty.setraw(fd, termios.TCSANOW)
+                # Keep output processing, so anything printed while in raw mode still starts new lines properly
+                mode = termios.tcgetattr(fd)
+                mode[tty.OFLAG] |= termios.OPOST
+                termios.tcsetattr(fd, termios.TCSANOW, mode)
+            elif not enable and saved:
+                termios.tcsetattr(fd, termios.TCSANOW, saved.pop())
+
+        def _linux_getch():
+            fd = sys.stdin.fileno()
+            if saved:
+                return os.read(fd, 1)
+
+            old_settings = termios.tcgetattr(fd)
+            try:
+                tty.setraw(fd, termios.TCSANOW)
+                ch = os.read(fd, 1)
+            finally:
+                termios.tcsetattr(fd, termios.TCSANOW, old_settings)
+            return ch
+
+        def _linux_is_key_avail():
+            dr, dw, de = select.select([sys.stdin], [], [], 0)
+            return dr != []
+
+        Utils.getch = _linux_getch
+        Utils.is_key_avail = _linux_is_key_avail
+        Utils.set_raw = _linux_set_raw
@@ -1,4 +1,5 @@
 from typing import Callable
+from animation import Animation, AnimatedTile
 from basetypes import Tile, Unit, RenderData, Color, Position
 
 
@@ -11,6 +12,19 @@ class WallTile(Tile):
         data.fg_color = Color(50, 255, 50)
 
 
+class WaterTile(AnimatedTile):
+    ANIMATION = Animation([
+        (RenderData(Color(200, 200, 255), Color(0, 60, 160), "~ "), 8),
+        (RenderData(Color(200, 200, 255), Color(0, 70, 180), " ~"), 8),
+    ])
+
+    def __init__(self, position: Position = Position(0, 0)):
+        super().__init__(position, WaterTile.ANIMATION)
+
+    def can_enter(self, unit: Unit):
+        return False
+
+
 class DelegateTile(Tile):
     def __init__(self, position: Position = None,
                  fcan_enter: Callable[[Tile, Unit], None] = None,
@@ -1,5 +1,5 @@
 from typing import Callable
-from basetypes import Unit, Map, Position, Tile, RenderData
+from basetypes import Unit, Map, Position, Tile, RenderData, Layer
 
 
 class DelegateUnit(Unit):
@@ -50,6 +50,8 @@ class DelegateUnit(Unit):
 
 
 class Collectible(Unit):
+    layer = Layer.ITEMS
+
     # noinspection PyMethodMayBeStatic,PyUnusedLocal
     def can_pickup(self, unit: Unit):
         return True
@@ -0,0 +1,221 @@
+from __future__ import annotations
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+import numpy as np
+import mapping
+from basetypes import Map, Position, Tile, Unit
+from game import Game
+from snapshot import Journal
+from workers import WorkerPool, serve
+
+GameFactory = Callable[[], Game]
+
+
+def debug_game():
+    return Game(mapping.debug_map())
+
+
+class Observations(NamedTuple):
+    """Compact state of every game, indexed by game first
+
+    tiles holds the type id of every tile (0 if there is none), units holds x, y and the type id of every unit,
+    padded with -1. Type ids are indices into :attr:`VecGame.types` plus one, shared by every process
+    """
+    tiles: np.ndarray  # (games, height, width) uint16
+    player: np.ndarray  # (games, 2) int32
+    units: np.ndarray  # (games, max units, 3) int32
+    done: np.ndarray  # (games,) bool
+    ticks: np.ndarray  # (games,) int64
+
+
+def collect_types(game: Game):
+    """Tile and unit types of a game in order of first appearance, followed by Tile and Unit as fallbacks"""
+    types = []
+    for tile in game.map.tiles.values():
+        for cls in (type(tile), *(type(unit) for unit in tile.units)):
+            if cls not in types:
+                types.append(cls)
+    return types + [cls for cls in (Tile, Unit) if cls not in types]
+
+
+class _Batch:
+    """Games stepped one after another by a single process"""
+
+    def __init__(self, factory: GameFactory, count: int, types: Sequence[type]):
+        self.factory = factory
+        self.types = list(types)
+        self._ids: Dict[type, int] = {cls: i + 1 for i, cls in enumerate(self.types)}
+        self.games: List[Game | None] = [None] * count
+        self.grids: List[np.ndarray | None] = [None] * count
+        self.units: List[Dict[Position, Tuple[Unit, ...]]] = [{} for _ in range(count)]
+        self.origins: List[Position | None] = [None] * count
+        self.done = np.zeros(count, dtype=bool)
+
+    def type_id(self, cls: type):
+        """Id of a type, types that are not registered get the id of their closest registered base class"""
+        if cls not in self._ids:
+            base = next((base for base in cls.__mro__ if base in self._ids), None)
+            if base is None:
+                raise ValueError(f"{cls.__name__} is not a registered type")
+            self._ids[cls] = self._ids[base]
+        return self._ids[cls]
+
+    def reset(self, i: int):
+        game = self.factory()
+        Journal(game.map)
+        origin, width, height = game.map.bounds()
+        grid = np.zeros((height, width), dtype=np.uint16)
+        units = {}
+        for pos, tile in game.map.tiles.items():
+            grid[pos.y - origin.y, pos.x - origin.x] = self.type_id(type(tile))
+            if tile.units:
+                units[pos] = tuple(tile.units)
+        self.games[i], self.grids[i], self.units[i], self.origins[i] = game, grid, units, origin
+        self.done[i] = False
+
+    def reset_all(self):
+        for i in range(len(self.games)):
+            self.reset(i)
+        return self.observe()
+
+    def step(self, actions: Sequence[bytes | None]):
+        for i, (game, action) in enumerate(zip(self.games, actions)):
+            if game is None or self.done[i]:
+                self.reset(i)
+                game = self.games[i]
+            Map.current = game.map
+            game.tick()
+            if action is not None and not game.handle(action):
+                self.done[i] = True
+            self._update(i)
+        return self.observe()
+
+    def _update(self, i: int):
+        """Applies the cells changed since the last step, as recorded by the journal of the game"""
+        journal = self.games[i].map.journal
+        grid, units, origin = self.grids[i], self.units[i], self.origins[i]
+        for pos in journal.unsaved:
+            tile = self.games[i].map.tile_at(pos)
+            if 0 <= pos.y - origin.y < grid.shape[0] and 0 <= pos.x - origin.x < grid.shape[1]:
+                grid[pos.y - origin.y, pos.x - origin.x] = self.type_id(type(tile)) if tile else 0
+            if tile and tile.units:
+                units[pos] = tuple(tile.units)
+            else:
+                units.pop(pos, None)
+        journal.unsaved.clear()
+
+    def observe(self):
+        shapes = {grid.shape for grid in self.grids}
+        if len(shapes) != 1:
+            raise ValueError("All games must have maps of the same size")
+
+        count = len(self.games)
+        longest = max((sum(len(u) for u in units.values()) for units in self.units), default=0)
+        player = np.full((count, 2), -1, dtype=np.int32)
+        units = np.full((count, longest, 3), -1, dtype=np.int32)
+        for i, game in enumerate(self.games):
+            if game.player.position:
+                player[i] = game.player.position.x, game.player.position.y
+            row = 0
+            for pos, occupants in self.units[i].items():
+                for unit in occupants:
+                    units[i, row] = pos.x, pos.y, self.type_id(type(unit))
+                    row += 1
+        ticks = np.array([game.ticks for game in self.games], dtype=np.int64)
+        return Observations(np.stack(self.grids), player, units, self.done.copy(), ticks)
+
+
+def _worker(conn: Connection, factory: GameFactory, count: int, types: Sequence[type]):
+    batch = _Batch(factory, count, types)
+
+    def handle(command: str, args):
+        if command == "reset":
+            return batch.reset_all()
+        elif command == "step":
+            return batch.step(args)
+        raise ValueError(f"Unknown command {command}")
+
+    serve(conn, handle)
+
+
+def _concat(parts: List[Observations]):
+    if len(parts) == 1:
+        return parts[0]
+    longest = max(part.units.shape[1] for part in parts)
+    units = [np.pad(part.units, ((0, 0), (0, longest - part.units.shape[1]), (0, 0)), constant_values=-1)
+             for part in parts]
+    return Observations(np.concatenate([p.tiles for p in parts]), np.concatenate([p.player for p in parts]),
+                        np.concatenate(units), np.concatenate([p.done for p in parts]),
+                        np.concatenate([p.ticks for p in parts]))
+
+
+class VecGame:
+    """Runs many independent headless games, stepping all of them with one call
+
+    Every step ticks each game once and then hands it its action, the same order main.py uses.
+    A game that ended (its action was ETX) is reset at the start of the next step
+
+    :param int count: Amount of games
+    :param GameFactory factory: Creates a fresh game, must be picklable when processes are used (default debug map)
+    :param int processes: Amount of worker processes the games are split between, 0 steps them in this process
+    :param Sequence[type]|None types: Tile and unit types in the order of their ids, subclasses of a registered
+        type share its id (default the types of a game created by the factory, see :func:`collect_types`)
+    """
+
+    def __init__(self, count: int, factory: GameFactory = debug_game, processes: int = 0,
+                 types: Sequence[type] | None = None):
+        self.count = count
+        self.types: List[type] = list(types) if types is not None else collect_types(factory())
+        self._batch: _Batch | None = None
+        self._pool = WorkerPool()
+        self._sizes: List[int] = []
+        if processes <= 0:
+            self._batch = _Batch(factory, count, self.types)
+            return
+
+        processes = min(processes, count)
+        for i in range(processes):
+            size = count // processes + (1 if i < count % processes else 0)
+            self._pool.start(_worker, factory, size, self.types)
+            self._sizes.append(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def type_of(self, type_id: int):
+        """Class a type id of the observations stands for, None for 0"""
+        return self.types[type_id - 1] if type_id > 0 else None
+
+    def close(self):
+        self._pool.close()
+
+    def reset(self):
+        """Creates a fresh game in every slot
+
+        :rtype: Observations
+        """
+        if self._batch:
+            return self._batch.reset_all()
+        return _concat(self._pool.exchange([("reset", None)] * len(self._pool)))
+
+    def step(self, actions: Sequence[bytes | None]):
+        """Advances every game by one tick and applies its action, None for no action
+
+        :param Sequence[bytes|None] actions: One key per game, as returned by :meth:`Utils.getch`
+        :rtype: Observations
+        :except ValueError: If the amount of actions does not match the amount of games
+        """
+        if len(actions) != self.count:
+            raise ValueError(f"Expected {self.count} actions, got {len(actions)}")
+        if self._batch:
+            return self._batch.step(actions)
+
+        messages = []
+        start = 0
+        for size in self._sizes:
+            messages.append(("step", list(actions[start:start + size])))
+            start += size
+        return _concat(self._pool.exchange(messages))
@@ -0,0 +1,94 @@
+from __future__ import annotations
+from typing import Dict, List
+from basetypes import Camera, Map, Position, RenderData, Tile, Unit
+from output import Frame
+from termansi import fwrite, GraphicMode
+
+BLANK = GraphicMode.RESET_COLOR + "  "
+
+
+class Viewport:
+    """A camera drawn into a rectangle of the screen
+
+    The rectangle is measured in tiles, every tile takes up two columns of the terminal
+
+    :param Camera camera: The camera looking at the map
+    :param Position offset: Top left corner of the rectangle on screen
+    :param int width: Width of the rectangle
+    :param int height: Height of the rectangle
+    :param Unit|None follow: Unit the camera is kept centered on
+    """
+
+    def __init__(self, camera: Camera, offset: Position, width: int, height: int, follow: Unit | None = None):
+        self.camera = camera
+        self.offset = offset
+        self.width = width
+        self.height = height
+        self.follow = follow
+
+    def update(self):
+        if self.follow and self.follow.position:
+            origin = Position(self.width // 2, self.height // 2) - self.follow.position
+            if origin != self.camera.origin:
+                self.camera.origin = origin
+
+    def screen_position(self, position: Position):
+        """Terminal cursor position of a tile, 1-based column and row"""
+        actual = position + self.camera.origin + self.offset
+        return actual.x * 2 + 1, actual.y + 1
+
+
+class Compositor:
+    """Renders several viewports of the same map in a single pass
+
+    Every tile seen by more than one viewport is drawn and encoded only once per frame,
+    the whole frame is then written to the terminal at once, or handed to a :class:`FrameWriter`
+    """
+
+    def __init__(self, viewports: List[Viewport] | None = None):
+        self.viewports: List[Viewport] = viewports or []
+
+    def compose(self, _map: Map | None = None, force=False):
+        """Builds the frame without writing it
+
+        :rtype: Frame
+        """
+        _map = _map or Map.current
+        frame = Frame(force)
+        cells = frame.cells
+
+        resolved: Dict[Position, str] = {}
+        drawn: List[Tile] = []
+        data = RenderData()
+        for viewport in self.viewports:
+            viewport.update()
+            full = force or viewport.camera.invalidated
+            viewport.camera.invalidated = False
+            left = -viewport.camera.origin.x
+            top = -viewport.camera.origin.y
+            if _map.entities:
+                _map.entities.flush((left, top, viewport.width, viewport.height))
+            for y in range(top, top + viewport.height):
+                for x in range(left, left + viewport.width):
+                    position = Position(x, y)
+                    tile = _map.tile_at(position)
+                    if not tile:
+                        if full:
+                            cells[viewport.screen_position(position)] = BLANK
+                        continue
+                    if not (full or tile.needs_redraw):
+                        continue
+
+                    cell = resolved.get(position)
+                    if cell is None:
+                        cell = resolved[position] = tile.encode(data)
+                        drawn.append(tile)
+                    cells[viewport.screen_position(position)] = cell
+
+        # Only clear once every viewport had the chance to draw the tile
+        for tile in drawn:
+            tile.clean()
+        return frame
+
+    def render(self, _map: Map | None = None, force=False):
+        fwrite(self.compose(_map, force).encode())
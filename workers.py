@@ -0,0 +1,75 @@
+from __future__ import annotations
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Sequence, Tuple
+
+Message = Tuple[str, Any]
+Handler = Callable[[str, Any], Any]
+
+
+def serve(conn: Connection, handle: Handler):
+    """Runs in a worker process, answers every (command, args) message with the result of handle until stopped
+
+    If handle raises, the exception is sent instead of an answer and the worker stops
+    """
+    try:
+        while True:
+            command, args = conn.recv()
+            if command == "stop":
+                break
+            conn.send(handle(command, args))
+    except Exception as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+
+class WorkerPool:
+    """Worker processes connected to this one by a pipe each, the workers are expected to call :func:`serve`"""
+
+    def __init__(self):
+        self.conns: List[Connection] = []
+        self.processes: List[Process] = []
+
+    def __len__(self):
+        return len(self.conns)
+
+    def start(self, target: Callable[..., None], *args):
+        """Starts a worker, target is called with its end of the pipe followed by args"""
+        parent, child = Pipe()
+        process = Process(target=target, args=(child, *args), daemon=True)
+        process.start()
+        child.close()
+        self.conns.append(parent)
+        self.processes.append(process)
+
+    def close(self):
+        for conn, process in zip(self.conns, self.processes):
+            try:
+                conn.send(("stop", None))
+            except (BrokenPipeError, OSError):
+                pass
+            process.join()
+            conn.close()
+        self.conns.clear()
+        self.processes.clear()
+
+    def exchange(self, messages: Sequence[Message], only: Sequence[Any] | None = None):
+        """Sends every worker its message and waits for all answers
+
+        :param Sequence[Message] messages: One message per worker
+        :param Sequence|None only: Only workers whose entry is truthy are sent their message, all if None
+        :returns: The answers of the messaged workers, in order
+        :rtype: list
+        :except RuntimeError: If a worker failed, caused by the exception of the worker
+        """
+        targets = [i for i in range(len(self.conns)) if only is None or only[i]]
+        for i in targets:
+            self.conns[i].send(messages[i])
+        results = []
+        for i in targets:
+            result = self.conns[i].recv()
+            if isinstance(result, Exception):
+                raise RuntimeError(f"Worker {i} failed") from result
+            results.append(result)
+        return results
@@ -0,0 +1,266 @@
+from __future__ import annotations
+import os
+import pickle
+import random
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from queue import Empty, PriorityQueue, SimpleQueue
+from threading import Event, Thread
+from typing import Dict, Iterator, List, Tuple
+from basetypes import Camera, Map, Position, Tile, Unit
+from tiles import WallTile
+
+ChunkTiles = Dict[Position, Tile]
+
+
+class ChunkGenerator:
+    """Creates the tiles of a chunk, must always return the same tiles for the same chunk
+
+    Runs on the background thread of :class:`ChunkedMap`, so it must not touch any map
+    """
+
+    def generate(self, chunk: Position, size: int) -> ChunkTiles:
+        ...
+
+
+class ScatterGenerator(ChunkGenerator):
+    """Open ground with randomly scattered walls, seeded per chunk
+
+    :param int seed: Seed of the world
+    :param float density: Chance of a tile being a wall (default 0.1)
+    """
+
+    def __init__(self, seed: int, density: float = 0.1):
+        self.seed = seed
+        self.density = density
+
+    def generate(self, chunk: Position, size: int):
+        rng = random.Random(f"{self.seed}:{chunk.x}:{chunk.y}")
+        tiles = {}
+        for y in range(chunk.y * size, (chunk.y + 1) * size):
+            for x in range(chunk.x * size, (chunk.x + 1) * size):
+                tiles[Position(x, y)] = WallTile() if rng.random() < self.density else Tile()
+        return tiles
+
+
+class ChunkStore:
+    """Keeps evicted chunks on disk, so changes made to them survive until they are loaded again
+
+    :param str path: Directory the chunks are stored in, created if missing
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, chunk: Position):
+        return os.path.join(self.path, f"{chunk.x}_{chunk.y}.chunk")
+
+    def load(self, chunk: Position) -> ChunkTiles | None:
+        try:
+            with open(self._file(chunk), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, chunk: Position, tiles: ChunkTiles):
+        with open(self._file(chunk), "wb") as f:
+            pickle.dump(tiles, f)
+
+
+class _LoadedTiles(MutableMapping):
+    """Tiles of all loaded chunks, viewed as a single dict"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.chunks: OrderedDict[Position, ChunkTiles] = OrderedDict()
+
+    def chunk_of(self, position: Position):
+        return Position(position.x // self.size, position.y // self.size)
+
+    def __getitem__(self, position: Position):
+        chunk = self.chunks.get(self.chunk_of(position))
+        if chunk is None:
+            raise KeyError(position)
+        return chunk[position]
+
+    def __setitem__(self, position: Position, tile: Tile):
+        chunk = self.chunks.get(self.chunk_of(position))
+        if chunk is None:
+            raise KeyError(f"Chunk of {position} is not loaded")
+        chunk[position] = tile
+
+    def __delitem__(self, position: Position):
+        chunk = self.chunks.get(self.chunk_of(position))
+        if chunk is None:
+            raise KeyError(position)
+        del chunk[position]
+
+    def __contains__(self, position):
+        chunk = self.chunks.get(self.chunk_of(position))
+        return chunk is not None and position in chunk
+
+    def __iter__(self) -> Iterator[Position]:
+        for chunk in self.chunks.values():
+            yield from chunk
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks.values())
+
+
+class ChunkedMap(Map):
+    """Unbounded map made of square chunks, generated or loaded on a background thread
+
+    Every tick the chunks around the followed units and cameras are requested, chunks that are not loaded yet
+    simply do not exist (:meth:`tile_at` returns None) so a frame never waits for generation. Once more than
+    max_chunks are loaded, the least recently used ones outside the kept area are evicted and saved on the
+    background thread as well. Errors of the background thread are raised by the next :meth:`update`
+
+    :param ChunkGenerator generator: Creates chunks that were never loaded before
+    :param int chunk_size: Width and height of a chunk in tiles (default 16)
+    :param int max_chunks: Memory budget, the amount of chunks kept loaded (default 256)
+    :param int prefetch: Radius in chunks requested around every focus (default 2)
+    :param ChunkStore|None store: Where evicted chunks are kept, evicted chunks are discarded and regenerated if None
+    """
+
+    def __init__(self, generator: ChunkGenerator, chunk_size: int = 16, max_chunks: int = 256, prefetch: int = 2,
+                 store: ChunkStore | None = None):
+        super().__init__({})
+        self.tiles = _LoadedTiles(chunk_size)
+        self.generator = generator
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.prefetch = prefetch
+        self.store = store
+        self.follow: List[Unit] = []
+        self.cameras: List[Camera] = []
+        self.evicted = 0
+        self._pending: set[Position] = set()
+        # Evicted chunks whose save has not finished yet, loading them has to wait for it
+        self._saving: Dict[Position, Event] = {}
+        # (priority, order, chunk, tiles to save or None to load), saves go first
+        self._requests: PriorityQueue[Tuple[int, int, Position | None, ChunkTiles | None]] = PriorityQueue()
+        # (chunk, whether it was saved instead of loaded, loaded tiles, error or None)
+        self._ready: SimpleQueue[Tuple[Position, bool, ChunkTiles | None, Exception | None]] = SimpleQueue()
+        self._order = 0
+        self._thread = Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stops the background thread once every evicted chunk is saved"""
+        self._order += 1
+        self._requests.put((-1, self._order, None, None))
+        self._thread.join()
+
+    def _work(self):
+        while True:
+            _, _, chunk, tiles = self._requests.get()
+            if chunk is None:
+                break
+            if tiles is not None:
+                try:
+                    self.store.save(chunk, tiles)
+                except Exception as e:
+                    self._ready.put((chunk, True, None, e))
+                finally:
+                    self._saving.pop(chunk).set()
+                continue
+            try:
+                self._ready.put((chunk, False, self._create(chunk), None))
+            except Exception as e:
+                self._ready.put((chunk, False, None, e))
+
+    def _create(self, chunk: Position):
+        saving = self._saving.get(chunk)
+        if saving:
+            saving.wait()
+        tiles = self.store.load(chunk) if self.store else None
+        return tiles if tiles is not None else self.generator.generate(chunk, self.chunk_size)
+
+    def load_now(self, position: Position):
+        """Loads the chunk containing position on the calling thread, meant for setting up the world
+
+        If the chunk was already requested, waits for the background thread instead of loading it twice
+        """
+        chunk = self.tiles.chunk_of(position)
+        while chunk in self._pending:
+            self._receive(self._ready.get())
+        if chunk not in self.tiles.chunks:
+            self._install(chunk, self._create(chunk))
+
+    def _receive(self, result: Tuple[Position, bool, ChunkTiles | None, Exception | None]):
+        chunk, saved, tiles, error = result
+        if saved:
+            raise RuntimeError(f"Saving chunk {chunk} failed") from error
+        self._pending.discard(chunk)
+        if error:
+            raise RuntimeError(f"Loading chunk {chunk} failed") from error
+        # Skip chunks that were loaded on the main thread in the meantime
+        if chunk not in self.tiles.chunks:
+            self._install(chunk, tiles)
+
+    def focus_points(self):
+        points = [unit.position for unit in self.follow if unit.position]
+        for camera in self.cameras:
+            points.append(Position(camera.frustum[0] // 4, camera.frustum[1] // 2) - camera.origin)
+        return points
+
+    def update(self):
+        """Installs generated chunks, requests missing ones around the focus points and evicts over budget
+
+        :except RuntimeError: If the background thread failed to load or save a chunk
+        """
+        while True:
+            try:
+                result = self._ready.get_nowait()
+            except Empty:
+                break
+            self._receive(result)
+
+        wanted: Dict[Position, int] = {}
+        for point in self.focus_points():
+            center = self.tiles.chunk_of(point)
+            for dy in range(-self.prefetch, self.prefetch + 1):
+                for dx in range(-self.prefetch, self.prefetch + 1):
+                    chunk = Position(center.x + dx, center.y + dy)
+                    distance = max(abs(dx), abs(dy))
+                    wanted[chunk] = min(distance, wanted.get(chunk, distance))
+
+        for chunk, distance in wanted.items():
+            if chunk in self.tiles.chunks:
+                self.tiles.chunks.move_to_end(chunk)
+            elif chunk not in self._pending:
+                self._pending.add(chunk)
+                self._order += 1
+                self._requests.put((distance, self._order, chunk, None))
+
+        chunks = self.tiles.chunks
+        if len(chunks) > self.max_chunks:
+            for chunk in [c for c in chunks if c not in wanted][:len(chunks) - self.max_chunks]:
+                self._evict(chunk)
+
+    def _install(self, chunk: Position, tiles: ChunkTiles):
+        for pos, tile in tiles.items():
+            tile.position = pos
+            tile.map = self
+            tile.invalidate()
+        self.tiles.chunks[chunk] = tiles
+        if self.animator:
+            for tile in tiles.values():
+                self.animator.adopt(tile)
+
+    def _evict(self, chunk: Position):
+        tiles = self.tiles.chunks.pop(chunk)
+        for pos, tile in tiles.items():
+            tile.map = None
+            self.invalidate(pos)
+        if self.store:
+            # Saved on the background thread, the tiles are no longer part of the map so nothing changes them
+            self._saving[chunk] = Event()
+            self._order += 1
+            self._requests.put((-1, self._order, chunk, tiles))
+        self.evicted += 1
+
+    def tick(self):
+        self.update()
+        super().tick()